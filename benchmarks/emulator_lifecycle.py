@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""
+Measures how long the emulator lifecycle takes -- booting, connecting, reconnecting and killing, alone and with several
+emulators at once -- and compares it against a stored baseline.
+
+The emulators are the stand-ins in benchmarks/fake_emulator, run through the usual PEBBLE_QEMU_PATH and PHONESIM_PATH,
+against a fake SDK in a temporary home directory. That means this runs on any Linux machine without an SDK, and what's
+measured is the tool's own overhead (plus --boot-delay) rather than QEMU's. Exits non-zero if any median regresses by
+more than the given tolerance.
+
+    python benchmarks/emulator_lifecycle.py                      # compare against the baseline
+    python benchmarks/emulator_lifecycle.py --concurrency 1,5,10
+    python benchmarks/emulator_lifecycle.py --update-baseline    # record a new baseline
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import atexit
+import bz2
+from collections import OrderedDict
+import errno
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKES = os.path.join(ROOT, 'benchmarks', 'fake_emulator')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'emulator_lifecycle_baseline.json')
+PLATFORMS = ['aplite', 'basalt', 'chalk', 'diorite', 'emery']
+
+
+def make_persist_dir(home):
+    persist_dir = os.path.join(home, '.pebble-sdk')
+    os.makedirs(persist_dir)
+    with open(os.path.join(persist_dir, 'NO_TRACKING'), 'w') as f:
+        f.write('benchmark')
+    # Don't go looking for updates when we exit.
+    with open(os.path.join(persist_dir, 'settings.json'), 'w') as f:
+        json.dump({'update-check-attempted': time.time()}, f)
+    return persist_dir
+
+
+def make_fake_sdk(sdks_dir, version):
+    """Creates just enough of an SDK for ManagedEmulatorTransport to launch emulators from."""
+    sdk_core = os.path.join(sdks_dir, version, 'sdk-core')
+    os.makedirs(os.path.join(sdk_core, 'pebble'))
+    with open(os.path.join(sdk_core, 'manifest.json'), 'w') as f:
+        json.dump({'version': version, 'type': 'sdk-core', 'requirements': []}, f)
+    with open(os.path.join(sdk_core, 'pebble', 'waf'), 'w') as f:
+        f.write('')
+    for platform in PLATFORMS:
+        qemu_dir = os.path.join(sdk_core, 'pebble', platform, 'qemu')
+        os.makedirs(qemu_dir)
+        with open(os.path.join(qemu_dir, 'qemu_micro_flash.bin'), 'wb') as f:
+            f.write(b'\xff' * 1024)
+        with bz2.BZ2File(os.path.join(qemu_dir, 'qemu_spi_flash.bin.bz2'), 'wb') as f:
+            f.write(b'\xff' * 65536)
+        with open(os.path.join(qemu_dir, 'layouts.json'), 'w') as f:
+            json.dump({}, f)
+
+
+def emulator_targets(count):
+    # (platform, sdk version) pairs; there's one emulator per pair, so we need a new fake SDK every five.
+    return [(PLATFORMS[i % len(PLATFORMS)], 'bench-{}'.format(i // len(PLATFORMS))) for i in range(count)]
+
+
+def open_connection(transport):
+    from libpebble2.communication import PebbleConnection
+    from pebble_tool.util.waiting import start_connection
+    connection = PebbleConnection(transport)
+    connection.connect()
+    start_connection(connection)
+    return connection
+
+
+def close_connection(connection):
+    # Close it cleanly, so that the connection's thread sees the close frame and stops quietly.
+    from pebble_tool.util.waiting import on_disconnect
+    closed = threading.Event()
+    on_disconnect(connection, closed.set)
+    connection.transport.ws.send_close()
+    closed.wait(5)
+    connection.transport.ws.shutdown()
+
+
+def wait_for_exit(pid, timeout=10):
+    # They're our children, so they hang around as zombies until they've been reaped.
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                return
+        except OSError as e:
+            if e.errno != errno.ECHILD:
+                raise
+            # subprocess reaped it for us (or it was never ours).
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                return
+        time.sleep(0.001)
+    raise RuntimeError("Process {} didn't exit.".format(pid))
+
+
+def boot(platform, version, transports):
+    """
+    Launches an emulator and connects to it, as `pebble install --emulator` would with none running. The transport is
+    added to `transports` before launching, so that it can be cleaned up even if launching fails.
+    """
+    from pebble_tool.sdk.emulator import ManagedEmulatorTransport
+    start = time.time()
+    transport = ManagedEmulatorTransport(platform, version)
+    transports.append(transport)
+    connection = open_connection(transport)
+    return time.time() - start, connection
+
+
+def kill(transports, connections=()):
+    """Kills the emulators, as `pebble kill` does, and waits for them to go away."""
+    from pebble_tool.commands.sdk.emulator import KillCommand
+    for connection in connections:
+        close_connection(connection)
+    pids = [pid for transport in transports for pid in (transport.qemu_pid, transport.pypkjs_pid)
+            if pid is not None]
+    start = time.time()
+    for pid in pids:
+        KillCommand._kill_if_running(pid, signal.SIGTERM)
+    for pid in pids:
+        wait_for_exit(pid)
+    return time.time() - start
+
+
+def measure_lifecycle(platform, version):
+    from pebble_tool.sdk.emulator import ManagedEmulatorTransport
+    timings = OrderedDict()
+    transports = []
+    killed = False
+    try:
+        timings['spawn'], connection = boot(platform, version, transports)
+        close_connection(connection)
+
+        # A new command connecting to the emulator that's now running.
+        start = time.time()
+        connection = open_connection(ManagedEmulatorTransport(platform, version))
+        timings['connect'] = time.time() - start
+
+        # The same transport connecting again after losing its connection.
+        close_connection(connection)
+        start = time.time()
+        connection = open_connection(connection.transport)
+        timings['reconnect'] = time.time() - start
+
+        timings['kill'] = kill([connection.transport], [connection])
+        killed = True
+    finally:
+        if not killed:
+            kill(transports)
+    return timings
+
+
+def measure_concurrency(count):
+    results = [None] * count
+    errors = []
+    transports = []
+
+    def run(i, platform, version):
+        try:
+            results[i] = boot(platform, version, transports)
+        except Exception as e:
+            errors.append(e)
+
+    start = time.time()
+    threads = [threading.Thread(target=run, args=(i, platform, version))
+               for i, (platform, version) in enumerate(emulator_targets(count))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    boot_time = time.time() - start
+    # Everything that was launched is killed, including emulators that failed to boot.
+    kill_time = kill(transports, [result[1] for result in results if result is not None])
+    if errors:
+        raise errors[0]
+    return boot_time, kill_time
+
+
+def summarise(timings):
+    timings = sorted(x * 1000 for x in timings)
+    return {'median_ms': timings[len(timings) // 2], 'min_ms': timings[0], 'max_ms': timings[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the emulator lifecycle with fake emulators.")
+    parser.add_argument('--platform', default='basalt', choices=PLATFORMS,
+                        help="Platform to use when timing a single emulator.")
+    parser.add_argument('--runs', type=int, default=3, help="Timed runs of each measurement.")
+    parser.add_argument('--concurrency', default='1,5', help="Comma-separated numbers of emulators to launch at once "
+                                                             "(default: 1,5).")
+    parser.add_argument('--boot-delay', type=float, default=0,
+                        help="How long, in seconds, the fake firmware takes to boot (default: 0).")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown over the baseline median, as a fraction (default: 0.2).")
+    parser.add_argument('--update-baseline', action='store_true', help="Save these results as the new baseline.")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+    args = parser.parse_args()
+    try:
+        concurrency = [int(x) for x in args.concurrency.split(',') if x]
+    except ValueError:
+        parser.error("--concurrency must be a list of numbers")
+
+    # Everything -- settings, SDKs, the emulator info file -- lives in a temporary home directory. pebble_tool does
+    # its cleanup at exit, so that has to outlive it; atexit handlers run in reverse order.
+    home = tempfile.mkdtemp(prefix='pebble-emulator-bench')
+    atexit.register(shutil.rmtree, home, ignore_errors=True)
+    os.environ.update({
+        'HOME': home,
+        'TMPDIR': home,
+        'PEBBLE_QEMU_PATH': os.path.join(FAKES, 'qemu-pebble'),
+        'PHONESIM_PATH': os.path.join(FAKES, 'phonesim.py'),
+        'FAKE_QEMU_BOOT_DELAY': str(args.boot_delay),
+    })
+    tempfile.tempdir = None
+    sdks_dir = os.path.join(make_persist_dir(home), 'SDKs')
+    for version in sorted({version for platform, version in emulator_targets(max(concurrency + [1]))}):
+        make_fake_sdk(sdks_dir, version)
+    os.symlink(os.path.join(sdks_dir, 'bench-0'), os.path.join(sdks_dir, 'current'))
+    sys.path.insert(0, ROOT)
+
+    lifecycle = OrderedDict()
+    for i in range(args.runs):
+        for name, value in measure_lifecycle(args.platform, 'bench-0').items():
+            lifecycle.setdefault(name, []).append(value)
+    results = OrderedDict((name, summarise(values)) for name, values in lifecycle.items())
+    for count in concurrency:
+        boots, kills = [], []
+        for i in range(args.runs):
+            boot_time, kill_time = measure_concurrency(count)
+            boots.append(boot_time)
+            kills.append(kill_time)
+        results['spawn-{}-concurrent'.format(count)] = summarise(boots)
+        results['kill-{}-concurrent'.format(count)] = summarise(kills)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (IOError, ValueError):
+        baseline = {}
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            limit = baseline[name]['median_ms'] * (1 + args.tolerance)
+            result['baseline_ms'] = baseline[name]['median_ms']
+            result['regressed'] = result['median_ms'] > limit
+            if result['regressed']:
+                regressions.append(name)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for name, result in results.items():
+            line = "{:<22} median {:8.1f}ms  (min {:.1f}ms, max {:.1f}ms)".format(
+                name, result['median_ms'], result['min_ms'], result['max_ms'])
+            if 'baseline_ms' in result:
+                line += "  baseline {:.1f}ms{}".format(result['baseline_ms'],
+                                                       "  REGRESSED" if result['regressed'] else "")
+            print(line)
+        if not baseline:
+            print("No baseline at {}; run with --update-baseline to record one.".format(args.baseline))
+
+    if regressions:
+        print("Regressed: {}".format(', '.join(regressions)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
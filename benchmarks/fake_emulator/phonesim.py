@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+A stand-in for pypkjs's phonesim.py, for benchmarking and testing the emulator lifecycle without an SDK.
+
+Accepts the arguments ManagedEmulatorTransport passes to phonesim.py, serves the developer connection's WebSocket
+protocol on --port, and relays messages between its clients and the (real or fake) QEMU given by --qemu. There's no
+JavaScript, app configuration or timeline; anything other than a message for the watch is ignored.
+
+    PHONESIM_PATH=benchmarks/fake_emulator/phonesim.py pebble install --emulator basalt
+
+Only the standard library is used.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import base64
+import hashlib
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+# The first byte of each developer connection message says what it is.
+RELAY_FROM_WATCH = 0x00
+RELAY_TO_WATCH = 0x01
+
+QEMU_HEADER = 0xFEED
+QEMU_FOOTER = 0xBEEF
+QEMU_PROTOCOL_SPP = 1
+
+
+class WebSocketClient(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        self.send_lock = threading.Lock()
+
+    def handshake(self):
+        request = b''
+        while not request.endswith(b'\r\n\r\n'):
+            line = self.file.readline()
+            if not line:
+                return False
+            request += line
+        key = None
+        for line in request.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            self.sock.sendall(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        self.sock.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        return True
+
+    def _read_exactly(self, length):
+        data = self.file.read(length)
+        if len(data) < length:
+            raise EOFError
+        return data
+
+    def read_frame(self):
+        first, second = struct.unpack('!BB', self._read_exactly(2))
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack('!H', self._read_exactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', self._read_exactly(8))
+        mask = bytearray(self._read_exactly(4)) if second & 0x80 else None
+        payload = bytearray(self._read_exactly(length))
+        if mask is not None:
+            for i in range(length):
+                payload[i] ^= mask[i % 4]
+        return opcode, bytes(payload)
+
+    def send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        with self.send_lock:
+            self.sock.sendall(header + payload)
+
+
+class PhoneSimulator(object):
+    def __init__(self, qemu_address):
+        self.qemu_address = qemu_address
+        self.qemu = None
+        self.qemu_lock = threading.Lock()
+        self.clients = []
+        self.clients_lock = threading.Lock()
+
+    def connect_to_qemu(self):
+        host, port = self.qemu_address
+        # QEMU may still be starting up.
+        for i in range(100):
+            try:
+                self.qemu = socket.create_connection((host, port))
+            except socket.error:
+                time.sleep(0.1)
+            else:
+                break
+        else:
+            raise SystemExit("phonesim.py (fake): couldn't connect to QEMU at {}:{}".format(host, port))
+        self.qemu.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        thread = threading.Thread(target=self.read_from_qemu)
+        thread.daemon = True
+        thread.start()
+
+    def read_from_qemu(self):
+        buffer = b''
+        while True:
+            data = self.qemu.recv(65536)
+            if not data:
+                print("phonesim.py (fake): QEMU went away.", file=sys.stderr)
+                sys.stderr.flush()
+                # Like pypkjs, there's nothing left to do without the emulator.
+                os._exit(1)
+            buffer += data
+            while len(buffer) >= 6:
+                header, protocol, length = struct.unpack_from('!HHH', buffer, 0)
+                if len(buffer) < 6 + length + 2:
+                    break
+                payload = buffer[6:6 + length]
+                buffer = buffer[6 + length + 2:]
+                if protocol == QEMU_PROTOCOL_SPP:
+                    self.broadcast(struct.pack('!B', RELAY_FROM_WATCH) + payload)
+
+    def broadcast(self, message):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.send_frame(OPCODE_BINARY, message)
+            except socket.error:
+                pass
+
+    def send_to_watch(self, message):
+        with self.qemu_lock:
+            self.qemu.sendall(struct.pack('!HHH', QEMU_HEADER, QEMU_PROTOCOL_SPP, len(message)) + message +
+                              struct.pack('!H', QEMU_FOOTER))
+
+    def handle_client(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = WebSocketClient(sock)
+        try:
+            if not client.handshake():
+                return
+            with self.clients_lock:
+                self.clients.append(client)
+            while True:
+                opcode, payload = client.read_frame()
+                if opcode == OPCODE_BINARY and payload[:1] == struct.pack('!B', RELAY_TO_WATCH):
+                    self.send_to_watch(payload[1:])
+                elif opcode == OPCODE_PING:
+                    client.send_frame(OPCODE_PONG, payload)
+                elif opcode == OPCODE_CLOSE:
+                    client.send_frame(OPCODE_CLOSE, payload[:2])
+                    break
+        except (EOFError, socket.error):
+            pass
+        finally:
+            with self.clients_lock:
+                if client in self.clients:
+                    self.clients.remove(client)
+            sock.close()
+
+    def serve(self, port):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('', port))
+        server.listen(5)
+        while True:
+            sock, _ = server.accept()
+            thread = threading.Thread(target=self.handle_client, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake pypkjs phone simulator.")
+    parser.add_argument('--qemu', default='localhost:12344')
+    parser.add_argument('--port', type=int, default=9000)
+    # Accepted so that we can be run in pypkjs's place; they make no difference here.
+    parser.add_argument('--persist')
+    parser.add_argument('--layout')
+    parser.add_argument('--oauth')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+
+    host, _, port = args.qemu.rpartition(':')
+    simulator = PhoneSimulator((host or 'localhost', int(port)))
+    simulator.connect_to_qemu()
+    simulator.serve(args.port)
+
+
+if __name__ == '__main__':
+    main()
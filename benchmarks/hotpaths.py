@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""
+Microbenchmarks for the tool's pure-Python hot paths, run on synthetic inputs and compared against a stored baseline.
+
+Nothing here needs a watch, an emulator or an SDK: screenshots are made up, log packets are built by hand, and projects
+and the analytics journal live in a temporary home directory. Exits non-zero if any benchmark's median time per call
+regresses by more than the given tolerance.
+
+    python benchmarks/hotpaths.py                      # compare against benchmarks/hotpaths_baseline.json
+    python benchmarks/hotpaths.py screenshot           # only the benchmarks whose names contain 'screenshot'
+    python benchmarks/hotpaths.py --update-baseline    # record a new baseline
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import atexit
+from collections import OrderedDict
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'hotpaths_baseline.json')
+
+# Benchmark name -> function that does any setup and returns the thing to time.
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.replace('_', '-')] = func
+    return func
+
+
+class _FakeConnection(object):
+    def __init__(self, platform):
+        self.watch_platform = platform
+
+
+class _NullOutput(object):
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def _screenshot(width, height, platform):
+    from pebble_tool.commands.screenshot import ScreenshotCommand
+    command = ScreenshotCommand()
+    command.pebble = _FakeConnection(platform)
+    # Every pixel is one of the 64 colours the watch can display, as they are in real screenshots.
+    levels = (0, 85, 170, 255)
+    image = [bytearray(levels[(x * 3 + y + c) % 4] for x in range(width) for c in range(3)) for y in range(height)]
+    return command, image
+
+
+@benchmark
+def screenshot_correct_colours_144x168():
+    command, image = _screenshot(144, 168, 'basalt')
+    return lambda: command._correct_colours(image)
+
+
+@benchmark
+def screenshot_correct_colours_180x180():
+    command, image = _screenshot(180, 180, 'chalk')
+    return lambda: command._correct_colours(image)
+
+
+@benchmark
+def screenshot_roundify_144x168():
+    command, image = _screenshot(144, 168, 'basalt')
+    return lambda: command._roundify(image)
+
+
+@benchmark
+def screenshot_roundify_180x180():
+    command, image = _screenshot(180, 180, 'chalk')
+    return lambda: command._roundify(image)
+
+
+def _log_printer():
+    from pebble_tool.util.logs import PebbleLogPrinter
+    # Skip the constructor, which wants to talk to a watch.
+    printer = PebbleLogPrinter.__new__(PebbleLogPrinter)
+    printer.pebble = _FakeConnection('basalt')
+    printer.print_with_colour = True
+    printer.sourcemap = None
+    return printer
+
+
+def _quiet(func, items):
+    def run():
+        stdout = sys.stdout
+        sys.stdout = _NullOutput()
+        try:
+            for item in items:
+                func(item)
+        finally:
+            sys.stdout = stdout
+    return run
+
+
+@benchmark
+def logs_watch_flood():
+    """Formats 1000 log messages from the watch, at every log level."""
+    import uuid
+    from libpebble2.protocol.logs import AppLogMessage
+    printer = _log_printer()
+    levels = (0, 1, 50, 100, 200, 255)
+    packets = [AppLogMessage(uuid=uuid.UUID(int=0), timestamp=0, level=levels[i % len(levels)], line_number=i,
+                             filename='main.c', message='Handling tick {} for the main window'.format(i))
+               for i in range(1000)]
+    return _quiet(printer.handle_watch_log, packets)
+
+
+@benchmark
+def logs_phone_sourcemap_flood():
+    """Formats 1000 log messages from pkjs, translating their locations with a 2000-line sourcemap."""
+    import sourcemap
+    from libpebble2.communication.transports.websocket.protocol import WebSocketPhoneAppLog
+    printer = _log_printer()
+    # Each generated line maps to the next line of src/js/app.js.
+    printer.sourcemap = sourcemap.loads(json.dumps({
+        'version': 3,
+        'file': 'pebble-js-app.js',
+        'sources': ['src/js/app.js'],
+        'names': [],
+        'mappings': ';'.join(['AAAA'] + ['AACA'] * 1999),
+    }))
+    packets = [WebSocketPhoneAppLog(payload=u'Error: oops at file:///data/app/pebble-js-app.js:{}:{}'.format(
+        1 + i % 2000, i % 40)) for i in range(1000)]
+    return _quiet(printer.handle_phone_log, packets)
+
+
+def _analytics_events(count):
+    return [{'event': 'sdk_command', 'identity': {'user': 'benchmark', 'sdk_client_id': 'x' * 36},
+             'data': {'command': 'build', 'platform': 'basalt', 'duration': i / 7.0}} for i in range(count)]
+
+
+@benchmark
+def analytics_append_to_backlog():
+    """Queues 20 events behind a backlog of 10000."""
+    from pebble_tool.util.analytics import PebbleAnalytics
+    PebbleAnalytics._take_events()
+    PebbleAnalytics._append_events(_analytics_events(10000))
+    events = _analytics_events(20)
+    return lambda: PebbleAnalytics._append_events(events)
+
+
+@benchmark
+def analytics_take_backlog():
+    """Claims a backlog of 10000 queued events (including writing the journal for it to claim)."""
+    from pebble_tool.util.analytics import PebbleAnalytics
+    PebbleAnalytics._take_events()
+    journal = ''.join(json.dumps(event) + '\n' for event in _analytics_events(10000)).encode('utf-8')
+
+    def run():
+        with open(PebbleAnalytics.journal_filename(), 'wb') as f:
+            f.write(journal)
+        PebbleAnalytics._take_events()
+    return run
+
+
+@benchmark
+def version_to_key_sort():
+    """Sorts 2000 SDK version strings."""
+    from pebble_tool.util.versions import version_to_key
+    versions = []
+    for i in range(2000):
+        major, minor = 2 + i % 3, i % 15
+        suffix = ('', '-dp{}'.format(i % 4), '-beta{}'.format(i % 12), '-rc{}'.format(i % 3))[i % 4]
+        versions.append('{}.{}{}'.format(major, minor, suffix) if i % 5 else '{}.{}.{}{}'.format(major, minor, i % 3,
+                                                                                                 suffix))
+    return lambda: sorted(versions, key=version_to_key)
+
+
+def _project(directory, filename, info):
+    os.makedirs(os.path.join(directory, 'src'))
+    with open(os.path.join(directory, 'wscript'), 'w') as f:
+        f.write('')
+    with open(os.path.join(directory, filename), 'w') as f:
+        json.dump(info, f)
+    return directory
+
+
+def _npm_project(directory):
+    return _project(directory, 'package.json', {
+        'name': 'benchmark', 'author': 'Benchmark', 'version': '1.0.0',
+        'dependencies': {'pebble-clay': '^1.0.0'}, 'devDependencies': {},
+        'pebble': {
+            'displayName': 'Benchmark', 'uuid': '8ba2a6b5-8ea3-4e25-a1b4-3d42f5d9ad4e', 'sdkVersion': '3',
+            'targetPlatforms': ['aplite', 'basalt', 'chalk', 'diorite', 'emery'], 'enableMultiJS': True,
+            'watchapp': {'watchface': False}, 'messageKeys': ['key{}'.format(i) for i in range(50)],
+            'resources': {'media': [{'type': 'bitmap', 'name': 'IMAGE_{}'.format(i), 'file': 'images/{}.png'.format(i)}
+                                    for i in range(200)]},
+        },
+    })
+
+
+def _uncached(project_dir):
+    from pebble_tool.sdk import project
+
+    def run():
+        # Forget everything, as a fresh run of the tool would have.
+        project._json_cache.clear()
+        project._project_cache.clear()
+        project.PebbleProject(project_dir)
+    return run
+
+
+@benchmark
+def project_parse_package_json():
+    return _uncached(_npm_project(os.path.join(tempfile.mkdtemp(dir=os.environ['HOME']), 'npm')))
+
+
+@benchmark
+def project_parse_appinfo_json():
+    directory = os.path.join(tempfile.mkdtemp(dir=os.environ['HOME']), 'appinfo')
+    return _uncached(_project(directory, 'appinfo.json', {
+        'uuid': '8ba2a6b5-8ea3-4e25-a1b4-3d42f5d9ad4e', 'shortName': 'benchmark', 'longName': 'Benchmark',
+        'companyName': 'Benchmark', 'versionLabel': '1.0', 'sdkVersion': '3',
+        'targetPlatforms': ['aplite', 'basalt', 'chalk'], 'watchapp': {'watchface': True},
+        'appKeys': {'key{}'.format(i): i for i in range(50)},
+        'resources': {'media': [{'type': 'bitmap', 'name': 'IMAGE_{}'.format(i), 'file': 'images/{}.png'.format(i)}
+                                for i in range(200)]},
+    }))
+
+
+@benchmark
+def project_cached():
+    """Gets an unchanged project again, as the daemon and batch runs do."""
+    from pebble_tool.sdk.project import PebbleProject
+    project_dir = _npm_project(os.path.join(tempfile.mkdtemp(dir=os.environ['HOME']), 'cached'))
+    return lambda: PebbleProject(project_dir)
+
+
+def make_persist_dir(home):
+    persist_dir = os.path.join(home, '.pebble-sdk')
+    os.makedirs(persist_dir)
+    with open(os.path.join(persist_dir, 'NO_TRACKING'), 'w') as f:
+        f.write('benchmark')
+    # Don't go looking for updates when we exit.
+    with open(os.path.join(persist_dir, 'settings.json'), 'w') as f:
+        json.dump({'update-check-attempted': time.time()}, f)
+
+
+def time_benchmark(func, runs, min_time):
+    # Pick a number of calls per run that takes at least min_time, then take the per-call time of each run.
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    timings = sorted(t / number * 1000000 for t in timeit.repeat(func, number=number, repeat=runs))
+    return {'median_us': timings[len(timings) // 2], 'min_us': timings[0], 'max_us': timings[-1], 'calls': number}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pebble tool's pure-Python hot paths.")
+    parser.add_argument('names', nargs='*', help="Only run benchmarks whose names contain one of these (default: "
+                                                 "all of {}).".format(', '.join(BENCHMARKS)))
+    parser.add_argument('--runs', type=int, default=7, help="Timed runs per benchmark.")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Minimum length of each run, in seconds.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown over the baseline median, as a fraction (default: 0.2).")
+    parser.add_argument('--update-baseline', action='store_true', help="Save these results as the new baseline.")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.names or any(x in name for x in args.names)]
+    if not names:
+        parser.error("no benchmarks match {}".format(', '.join(args.names)))
+
+    # Keep the analytics journal and projects away from the developer's own. pebble_tool does its cleanup at exit,
+    # so the home directory has to outlive that; atexit handlers run in reverse order.
+    home = tempfile.mkdtemp(prefix='pebble-hotpaths-bench')
+    atexit.register(shutil.rmtree, home, ignore_errors=True)
+    os.environ['HOME'] = home
+    make_persist_dir(home)
+    sys.path.insert(0, ROOT)
+    results = OrderedDict()
+    for name in names:
+        results[name] = time_benchmark(BENCHMARKS[name](), args.runs, args.min_time)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (IOError, ValueError):
+        baseline = {}
+
+    if args.update_baseline:
+        # Keep the baseline for any benchmarks we didn't run this time.
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            limit = baseline[name]['median_us'] * (1 + args.tolerance)
+            result['baseline_us'] = baseline[name]['median_us']
+            result['change'] = result['median_us'] / result['baseline_us'] - 1
+            result['regressed'] = result['median_us'] > limit
+            if result['regressed']:
+                regressions.append(name)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for name, result in results.items():
+            line = "{:<36} median {:>11.1f}us  (min {:.1f}us, max {:.1f}us)".format(
+                name, result['median_us'], result['min_us'], result['max_us'])
+            if 'baseline_us' in result:
+                line += "  baseline {:.1f}us ({:+.0%}){}".format(result['baseline_us'], result['change'],
+                                                                "  REGRESSED" if result['regressed'] else "")
+            print(line)
+        if not baseline:
+            print("No baseline at {}; run with --update-baseline to record one.".format(args.baseline))
+
+    if regressions:
+        print("Regressed: {}".format(', '.join(regressions)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Measures cold-start time of the pebble tool, and compares it against a stored baseline.
+
+Each command is run in a fresh interpreter, with an isolated home and temporary directory so that neither the
+developer's settings nor any running emulators are involved. Exits non-zero if any command's median time regresses by
+more than the given tolerance.
+
+    python benchmarks/startup.py                      # compare against benchmarks/startup_baseline.json
+    python benchmarks/startup.py --update-baseline    # record a new baseline
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_COMMANDS = ['--version', '--help', 'emu-tap --help', 'ping', 'kill']
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'startup_baseline.json')
+
+
+def make_environment(home):
+    env = {k: v for k, v in os.environ.items() if not k.startswith('PEBBLE_')}
+    env['HOME'] = home
+    env['TMPDIR'] = home
+    env['PYTHONPATH'] = ROOT
+    persist_dir = os.path.join(home, '.pebble-sdk')
+    os.makedirs(persist_dir)
+    with open(os.path.join(persist_dir, 'NO_TRACKING'), 'w') as f:
+        f.write('benchmark')
+    return env
+
+
+def time_command(command, env, runs):
+    args = [sys.executable, os.path.join(ROOT, 'pebble.py')] + command.split()
+    timings = []
+    with open(os.devnull, 'w') as null:
+        # One untimed run, so that on-disk caches are populated as they would be in normal use.
+        subprocess.call(args, env=env, cwd=env['HOME'], stdout=null, stderr=null)
+        for i in range(runs):
+            start = time.time()
+            subprocess.call(args, env=env, cwd=env['HOME'], stdout=null, stderr=null)
+            timings.append((time.time() - start) * 1000)
+    timings.sort()
+    return {'median': timings[len(timings) // 2], 'min': timings[0], 'max': timings[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pebble tool startup time.")
+    parser.add_argument('commands', nargs='*', default=DEFAULT_COMMANDS,
+                        help="pebble commands to time (default: {})".format(', '.join(DEFAULT_COMMANDS)))
+    parser.add_argument('--runs', type=int, default=15, help="Timed runs per command.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown over the baseline median, as a fraction (default: 0.2).")
+    parser.add_argument('--update-baseline', action='store_true', help="Save these results as the new baseline.")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix='pebble-startup-bench')
+    try:
+        env = make_environment(home)
+        results = {command: time_command(command, env, args.runs) for command in args.commands}
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (IOError, ValueError):
+        baseline = {}
+
+    regressions = []
+    for command in args.commands:
+        result = results[command]
+        if command in baseline:
+            limit = baseline[command]['median'] * (1 + args.tolerance)
+            result['baseline'] = baseline[command]['median']
+            result['regressed'] = result['median'] > limit
+            if result['regressed']:
+                regressions.append(command)
+
+    if args.json:
+        print(json.dumps(results, indent=4, sort_keys=True))
+    else:
+        for command in args.commands:
+            result = results[command]
+            line = "{:<20} median {:7.1f}ms  (min {:.1f}ms, max {:.1f}ms)".format(
+                command, result['median'], result['min'], result['max'])
+            if 'baseline' in result:
+                line += "  baseline {:.1f}ms{}".format(result['baseline'], "  REGRESSED" if result['regressed'] else "")
+            print(line)
+        if not baseline:
+            print("No baseline at {}; run with --update-baseline to record one.".format(args.baseline))
+
+    if regressions:
+        print("Startup time regressed for: {}".format(', '.join(regressions)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,54 +4,133 @@ __author__ = 'katharine'
 import atexit
 import argparse
 import logging
+import os
 import sys
-import requests.packages.urllib3 as urllib3
+import warnings
 
+# This needs to happen before we import anything else, so the imports can be timed.
+from .util import global_options, profiling
+
+
+def _enable_profiling(options):
+    if options.get('--profile-startup') or os.environ.get('PEBBLE_PROFILE_STARTUP'):
+        profiling.enable()
+    if options.get('--trace'):
+        profiling.enable_trace(options['--trace'])
+    elif os.environ.get('PEBBLE_TRACE'):
+        profiling.enable_trace(os.environ['PEBBLE_TRACE'])
+
+
+_enable_profiling(global_options.split(sys.argv[1:])[0])
+
+from .util import stats
 from .exceptions import ToolError
 from .sdk import sdk_version
-from .util.analytics import wait_for_analytics, analytics_prompt
+from .util import parser_cache
+from .util.daemon import forward_to_daemon
+from .util.analytics import flush_analytics, analytics_prompt
 from .util.config import config
-from .util.updates import wait_for_update_checks
+from .util import endpoint_stats, perf_history
+from .util.updates import handle_updates
 from .util.wsl import maybe_apply_wsl_hacks
 from .version import __version__, __version_info__
 
-# Violating PEP8 for custom command ordering for `pebble -h`
-from .commands.sdk import manage
-from .commands.sdk.project import build
+from .commands.base import register_children, load_all_commands
 
-from .commands.base import register_children
-from .commands import (install, logs, screenshot, timeline, emucontrol, ping, account, repl,
-                       transcription_server, data_logging)
-from .commands.sdk import create, emulator
-from .commands.sdk.project import package, analyse_size, convert, debug
 
-def run_tool(args=None):
-    urllib3.disable_warnings()  # sigh. :(
-    logging.basicConfig()
-    maybe_apply_wsl_hacks()
-    analytics_prompt()
+def build_parser(args):
     parser = argparse.ArgumentParser(description="Pebble Tool", prog="pebble",
                                      epilog="For help on an individual command, call that command with --help.")
     version_string = "Pebble Tool v{}".format(__version__)
     if sdk_version() is not None:
         version_string += " (active SDK: v{})".format(sdk_version())
     parser.add_argument("--version", action="version", version=version_string)
-    register_children(parser)
-    args = parser.parse_args(args)
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Report where time was spent on imports and startup. Equivalent to "
+                             "PEBBLE_PROFILE_STARTUP.")
+    parser.add_argument("--stats", action="store_true",
+                        help="Report the wall time, CPU time, peak memory use and watch traffic of this run.")
+    parser.add_argument("--stats-json", metavar="FILE", help="Like --stats, but write the report to FILE as JSON.")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a timeline of this run (imports, connecting, emulator startup, builds, transfers) "
+                             "to FILE, in Chrome's trace format. Equivalent to PEBBLE_TRACE=FILE.")
+    with profiling.phase("register_children"):
+        register_children(parser, args)
+    return parser, version_string
+
+
+def _get_command_tree():
+    tree = parser_cache.load_tree(sdk_version())
+    if tree is None:
+        load_all_commands()
+        parser, version_string = build_parser([])
+        tree = parser_cache.describe_parser(parser, version_string)
+        parser_cache.save_tree(sdk_version(), tree)
+    return tree
+
+
+def run_tool(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # sigh. :( (this is urllib3.disable_warnings(), without importing requests to do it.)
+    warnings.filterwarnings('ignore', module=r'requests\.packages\.urllib3')
+    logging.basicConfig()
+    if args[:1] == ['--complete']:
+        print("\n".join(parser_cache.complete(_get_command_tree(), args[1:])))
+        return
+    options = global_options.split(args)[0]
+    _enable_profiling(options)
+    _enable_stats(options)
+    with profiling.phase("maybe_apply_wsl_hacks"):
+        maybe_apply_wsl_hacks()
+    with profiling.phase("analytics_prompt"):
+        analytics_prompt()
+    if args == ['--version'] or args[-1:] in (['-h'], ['--help']):
+        response = parser_cache.cached_response(_get_command_tree(), args)
+        if response is not None:
+            stream, text = response
+            getattr(sys, stream).write(text)
+            return
+    with profiling.phase("forward_to_daemon"):
+        status = forward_to_daemon(args)
+    if status is not None:
+        sys.exit(status)
+    with profiling.phase("parser construction"):
+        parser, version_string = build_parser(args)
+    with profiling.phase("parse_args"):
+        args = parser.parse_args(args)
     if not hasattr(args, 'func'):
         parser.error("no subcommand specified.")
     try:
-        args.func(args)
+        with profiling.phase("command"):
+            args.func(args)
     except ToolError as e:
         parser.exit(message=unicode(e)+"\n", status=1)
         sys.exit(1)
 
 
+def _enable_stats(options):
+    if options.get('--stats-json'):
+        stats.enable(options['--stats-json'])
+    elif options.get('--stats'):
+        stats.enable()
+
+
+# Background jobs (see pebble_tool.util.detached) import this package too, but aren't a run of the tool, so they turn
+# this off: they'd otherwise post analytics, check for updates (starting yet another job), etc. when they exit.
+cleanup_at_exit = True
+
+
 @atexit.register
 def wait_for_cleanup():
-    import time
-    now = time.time()
-    wait_for_analytics(2)
-    wait_for_update_checks(2)
-    logging.info("Spent %f seconds waiting for analytics.", time.time() - now)
-    config.save()
+    if not cleanup_at_exit:
+        return
+    with profiling.phase("wait_for_cleanup"):
+        flush_analytics()
+        perf_history.flush()
+        handle_updates()
+        config.save()
+    profiling.report()
+    profiling.write_trace()
+    stats.report()
+    endpoint_stats.log_all()
@@ -1,10 +1,14 @@
 from __future__ import absolute_import
 
+import atexit
+import datetime
 import httplib2
 import json
+import logging
 import os
 import os.path
 import requests
+import threading
 
 from oauth2client.client import OAuth2WebServerFlow
 from oauth2client.client import Credentials
@@ -21,6 +25,11 @@ ME_URI        = AUTH_SERVER + "/api/v1/me.json"
 SDK_CLIENT_ID     = os.getenv("PEBBLE_OAUTH_APP_ID", "8b9140c7b1f101a84a26cab03e6b12273af36829d0e6540394dae61196fe5e7b")
 SDK_CLIENT_SECRET = os.getenv("PEBBLE_OAUTH_APP_SECRET", "8fdcbceafcbca6f9fdb6432cfcc246180bb59bcea957795b12efb5527397e2a1")
 
+# Access tokens are refreshed in the background once they're this close to expiring.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+logger = logging.getLogger("pebble_tool.account")
+
 flow = OAuth2WebServerFlow(
     client_id=SDK_CLIENT_ID,
     client_secret=SDK_CLIENT_SECRET,
@@ -35,21 +44,56 @@ class Account(object):
         self.persistent_dir = persistent_dir
         self.storage = Storage(os.path.join(self.persistent_dir, 'oauth_storage'))
         self._user_info = None
-        self._get_user_info()
+        self._credentials = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
 
     @property
     def is_logged_in(self):
-        return True if self.storage.get() else False
+        return True if self.get_credentials() else False
 
     def get_credentials(self):
-        return self.storage.get()
+        if self._credentials is None:
+            self._credentials = self.storage.get()
+        return self._credentials
 
     def refresh_credentials(self):
         creds = self.get_credentials()
         if creds:
             creds.refresh(httplib2.Http())
 
+    def refresh_if_expiring(self):
+        """
+        Starts refreshing the access token in the background if it's about to expire, so that whoever needs it next
+        (probably) doesn't have to wait. Call this only when a token is about to be needed: the refresh is waited for
+        before we exit.
+        """
+        creds = self.get_credentials()
+        if not creds or creds.token_expiry is None:
+            return
+        if creds.token_expiry - REFRESH_MARGIN > datetime.datetime.utcnow():
+            return
+        with self._refresh_lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh)
+            self._refresh_thread.daemon = True
+            self._refresh_thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh_credentials()
+        except Exception as e:
+            # If this didn't work, we'll try again (and report the problem) when the token is actually needed.
+            logger.debug("Background token refresh failed: %s", e)
+
+    def _wait_for_refresh(self):
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join()
+
     def get_access_token(self):
+        self._wait_for_refresh()
         creds = self.get_credentials()
         token_info = creds.get_access_token()
         return token_info.access_token
@@ -60,6 +104,14 @@ class Account(object):
     def id(self):
         return self._get_user_info()['id']
 
+    @property
+    def cached_id(self):
+        """The user's ID if we already have it saved, or None. Unlike :attr:`id`, this never asks the auth server."""
+        if not self.is_logged_in:
+            return None
+        user_info = self._read_user_info()
+        return user_info['id'] if user_info is not None else None
+
     @property
     def name(self):
         return self._get_user_info()['name']
@@ -95,10 +147,15 @@ class Account(object):
         creds = self._set_expiration_to_long_time(tools.run_flow(flow, self.storage, args))
 
         self.storage.put(creds)
-        self.user_info = self._get_user_info()
+        self._credentials = None
+        self._user_info = None
+        self._get_user_info()
 
     def logout(self):
+        self._wait_for_refresh()
         self.storage.delete()
+        self._credentials = None
+        self._user_info = None
         os.unlink(self._user_info_path)
 
     def _get_user_info(self):
@@ -108,12 +165,10 @@ class Account(object):
         if not self.is_logged_in:
             return None
 
-        file_path = self._user_info_path
-        try:
-            with open(file_path) as f:
-                return json.load(f)
-        except (IOError, ValueError):
-            with open(file_path, 'w') as f:
+        if self._read_user_info() is not None:
+            return self._user_info
+        else:
+            with open(self._user_info_path, 'w') as f:
                 result = requests.get(ME_URI, headers={'Authorization': 'Bearer %s' % self.get_access_token()})
                 result.raise_for_status()
                 account_info = result.json()
@@ -128,9 +183,33 @@ class Account(object):
                 self._user_info = stored_info
                 return self._user_info
 
+    def _read_user_info(self):
+        if self._user_info is None:
+            try:
+                with open(self._user_info_path) as f:
+                    self._user_info = json.load(f)
+            except (IOError, ValueError):
+                pass
+        return self._user_info
+
+
+_default_account = None
+_default_account_lock = threading.Lock()
+
 
 def get_default_account():
-    path = os.path.join(get_persist_dir(), 'oauth')
-    if not os.path.exists(path):
-        os.makedirs(path)
-    return Account(path)
+    global _default_account
+    with _default_account_lock:
+        if _default_account is None:
+            path = os.path.join(get_persist_dir(), 'oauth')
+            if not os.path.exists(path):
+                os.makedirs(path)
+            _default_account = Account(path)
+    return _default_account
+
+
+@atexit.register
+def _wait_for_refresh():
+    # The refresh runs on a daemon thread, which would be killed at exit, perhaps halfway through saving the new token.
+    if _default_account is not None:
+        _default_account._wait_for_refresh()
@@ -3,25 +3,78 @@ __author__ = 'katharine'
 from six import with_metaclass
 
 import argparse
+from collections import OrderedDict
+import importlib
 import logging
 import os
+import sys
+import threading
 import time
 
-from libpebble2.communication import PebbleConnection
-from libpebble2.communication.transports.qemu import QemuTransport
-from libpebble2.communication.transports.websocket import WebsocketTransport
-from libpebble2.communication.transports.serial import SerialTransport
-from libpebble2.exceptions import ConnectionError
-from libpebble2.protocol.system import TimeMessage, SetUTC
-
 from pebble_tool.exceptions import ToolError
 from pebble_tool.sdk import pebble_platforms, sdk_version
-from pebble_tool.sdk.emulator import ManagedEmulatorTransport, get_all_emulator_info
-from pebble_tool.sdk.cloudpebble import CloudPebbleTransport
+from pebble_tool.util import endpoint_stats, global_options, perf_history, profiling, stats, transport_recording
 from pebble_tool.util.analytics import post_event
+from pebble_tool.util.waiting import start_connection
+
+logger = logging.getLogger("pebble_tool.commands.base")
 
 _CommandRegistry = []
 
+# Command modules (and libpebble2, requests, oauth2client, etc. with them) are only imported once their command has
+# been selected. This table provides everything `pebble -h` needs without importing anything, and also determines the
+# order in which commands are listed. The summaries must match the command docstrings; tests/test_commands.py checks
+# that they do.
+_LazyCommands = OrderedDict([
+    ('sdk', ('pebble_tool.commands.sdk.manage', "Manages available SDKs")),
+    ('build', ('pebble_tool.commands.sdk.project.build', "Builds the current project.")),
+    ('clean', ('pebble_tool.commands.sdk.project.build', "Deletes everything the current project's builds have "
+                                                         "produced.")),
+    ('install', ('pebble_tool.commands.install', "Installs the given app on the watch.")),
+    ('logs', ('pebble_tool.commands.logs', "Displays running logs from the watch.")),
+    ('screenshot', ('pebble_tool.commands.screenshot', "Takes a screenshot from the watch.")),
+    ('insert-pin', ('pebble_tool.commands.timeline', "Inserts a pin into the timeline.")),
+    ('delete-pin', ('pebble_tool.commands.timeline', "Deletes a pin from the timeline.")),
+    ('emu-accel', ('pebble_tool.commands.emucontrol', "Emulates accelerometer events.")),
+    ('emu-app-config', ('pebble_tool.commands.emucontrol', "Shows the app configuration page, if one exists.")),
+    ('emu-battery', ('pebble_tool.commands.emucontrol', "Sets the emulated battery level and charging state.")),
+    ('emu-bt-connection', ('pebble_tool.commands.emucontrol', "Sets the emulated Bluetooth connectivity state.")),
+    ('emu-compass', ('pebble_tool.commands.emucontrol', "Sets the emulated compass heading and calibration state.")),
+    ('emu-control', ('pebble_tool.commands.emucontrol', "Control emulator interactively")),
+    ('emu-tap', ('pebble_tool.commands.emucontrol', "Emulates a tap.")),
+    ('emu-time-format', ('pebble_tool.commands.emucontrol', "Sets the emulated time format (12h or 24h).")),
+    ('emu-set-timeline-quick-view', ('pebble_tool.commands.emucontrol', "Shows or hides the emulated timeline quick "
+                                                                     "view.")),
+    ('emu-set-content-size', ('pebble_tool.commands.emucontrol', "Sets the emulated content size.")),
+    ('ping', ('pebble_tool.commands.ping', "Pings the watch.")),
+    ('login', ('pebble_tool.commands.account', "Logs you in to your Pebble account. Required to use the timeline "
+                                                "and CloudPebble connections.")),
+    ('logout', ('pebble_tool.commands.account', "Logs you out of your Pebble account.")),
+    ('repl', ('pebble_tool.commands.repl', "Launches a python prompt with a 'pebble' object already connected.")),
+    ('transcribe', ('pebble_tool.commands.transcription_server', "Starts a voice server listening for voice "
+                                                                 "transcription requests from the app")),
+    ('data-logging', ('pebble_tool.commands.data_logging', "Get info on or download data logging data")),
+    ('new-project', ('pebble_tool.commands.sdk.create', "Creates a new pebble project with the given name in a new "
+                                                        "directory.")),
+    ('new-package', ('pebble_tool.commands.sdk.create', "Creates a new pebble package (not app or watchface) with "
+                                                        "the given name in a new directory.")),
+    ('kill', ('pebble_tool.commands.sdk.emulator', "Kills running emulators, if any.")),
+    ('wipe', ('pebble_tool.commands.sdk.emulator', "Wipes data for running emulators. By default, only clears data "
+                                                   "for the current SDK version.")),
+    ('package', ('pebble_tool.commands.sdk.project.package', "Manages npm packages.")),
+    ('analyze-size', ('pebble_tool.commands.sdk.project.analyse_size', "Analyze the size of your pebble app.")),
+    ('convert-project', ('pebble_tool.commands.sdk.project.convert', "Converts an appinfo project from SDK 2 or SDK "
+                                                                     "3 to a modern package.json project.")),
+    ('gdb', ('pebble_tool.commands.sdk.project.debug', "Connects a debugger to the current app. Only works in the "
+                                                       "emulator.")),
+    ('daemon', ('pebble_tool.commands.daemon', "Keeps connections open in the background, and runs watch and "
+                                               "emulator commands over them.")),
+    ('batch', ('pebble_tool.commands.batch', "Runs a list of pebble commands, sharing connections between them.")),
+    ('perf', ('pebble_tool.commands.perf', "Shows how long builds, installs, emulator boots, screenshots and "
+                                           "connecting have been taking.")),
+    ('bench', ('pebble_tool.commands.bench', "Measures the latency and throughput of the connection to the watch.")),
+])
+
 
 class SelfRegisteringCommand(type):
     def __init__(cls, name, bases, dct):
@@ -56,6 +109,7 @@ class BaseCommand(with_metaclass(SelfRegisteringCommand)):
     def __call__(self, args):
         self._set_debugging(args.v)
         post_event("invoke_command_{}".format(self.command))
+        stats.set_command(self.command)
 
     def _set_debugging(self, level):
         self._verbosity = level
@@ -69,13 +123,69 @@ class BaseCommand(with_metaclass(SelfRegisteringCommand)):
             logging.getLogger().setLevel(verbosity)
 
 
+class ConnectionPool(object):
+    """Keeps connections open, so that several commands run by one process can share them."""
+    def __init__(self):
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def get(self, handler_impl, args, connect):
+        key = (handler_impl.name,) + tuple(handler_impl._connect_args(args) or ())
+        # Connections to different targets may be opened at the same time, but we only want one to each.
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            connection = self.connections.get(key)
+            if connection is None or not connection.connected:
+                connection = connect(handler_impl, args)
+                self.connections[key] = connection
+            return connection
+
+    def close(self):
+        """Closes every connection in the pool."""
+        with self.lock:
+            connections, self.connections = list(self.connections.values()), {}
+        for connection in connections:
+            # libpebble2 has no way to close a connection, so close whatever its transport is connected through.
+            for name in ('ws', 'socket', 'connection'):
+                handle = getattr(connection.transport, name, None)
+                if hasattr(handle, 'close'):
+                    try:
+                        handle.close()
+                    except Exception as e:
+                        logger.debug("Couldn't close %s: %s", connection.transport, e)
+                    break
+
+
 class PebbleCommand(BaseCommand):
     connection_handlers = set()
+    # If set, connections are taken from (and kept in) this ConnectionPool instead of being made for each command.
+    connection_pool = None
+    # Interactive commands need the user's terminal, so are never run by `pebble daemon` or on several targets.
+    interactive = False
+    # When the command is being run on several targets at once, the name of the one this instance is working on.
+    target_name = None
 
     @classmethod
     def register_connection_handler(cls, impl):
         cls.connection_handlers.add(impl)
 
+    @classmethod
+    def add_parser(cls, parser):
+        parser = super(PebbleCommand, cls).add_parser(parser)
+        parser.set_defaults(func=cls._run_for_targets)
+        return parser
+
+    @classmethod
+    def _run_for_targets(cls, args):
+        from .fan_out import run_on_targets, targets_for
+        targets = targets_for(cls, args)
+        if targets is None:
+            cls()(args)
+        else:
+            run_on_targets(cls, args, targets)
+
     @classmethod
     def _shared_parser(cls):
         parser = argparse.ArgumentParser(add_help=False)
@@ -88,6 +198,16 @@ class PebbleCommand(BaseCommand):
             group = parser
         for handler_impl in handlers:
             handler_impl.add_argument_handler(group)
+        targets_group = parser.add_argument_group("multiple targets")
+        if PebbleTransportEmulator in handlers:
+            targets_group.add_argument('--all-emulators', action='store_true',
+                                       help="Run on every emulator that's currently running, in parallel.")
+        targets_group.add_argument('--group', metavar='name',
+                                   help="Run on every target in the named group from 'device-groups' in your "
+                                        "settings, in parallel.")
+        parser.add_argument('--record-transport', metavar='file',
+                            help="Record everything sent to and received from the watch in this file, so that the "
+                                 "command can be replayed later with --replay-transport.")
         return super(PebbleCommand, cls)._shared_parser() + [parser]
 
     @classmethod
@@ -99,6 +219,7 @@ class PebbleCommand(BaseCommand):
         return set([handler for handler in cls.connection_handlers if handler.name in valid_connections])
 
     def __call__(self, args):
+        from libpebble2.exceptions import ConnectionError
         super(PebbleCommand, self).__call__(args)
         try:
             self.pebble = self._connect(args)
@@ -106,8 +227,14 @@ class PebbleCommand(BaseCommand):
             raise ToolError(str(e))
 
     def _connect(self, args):
+        with profiling.phase("connect", 'connect'):
+            return self._connect_to_selected(args)
+
+    def _connect_to_selected(self, args):
         self._set_debugging(args.v)
-        for handler_impl in self.valid_connection_handlers():
+        # Connections given on the command line take precedence over environment variables.
+        handlers = sorted(self.valid_connection_handlers(), key=lambda handler: not getattr(args, handler.name, None))
+        for handler_impl in handlers:
             if handler_impl.is_selected(args):
                 break
         else:
@@ -117,11 +244,32 @@ class PebbleCommand(BaseCommand):
             else:
                 raise ToolError("No pebble connection specified.")
 
-        transport = handler_impl.get_transport(args)
+        # Recordings have to start with a fresh connection, and replays have to have one to themselves.
+        if self.connection_pool is not None and not getattr(args, 'record_transport', None) \
+                and handler_impl is not PebbleTransportReplay:
+            return self.connection_pool.get(handler_impl, args, self._open_connection)
+        return self._open_connection(handler_impl, args)
+
+    def _open_connection(self, handler_impl, args):
+        from libpebble2.communication import PebbleConnection
+        start = time.time()
+        with profiling.phase("get_transport", 'connect', transport=handler_impl.name):
+            transport = handler_impl.get_transport(args)
+        if getattr(args, 'record_transport', None):
+            transport_recording.record(transport, args.record_transport, handler_impl.name)
+        stats.count_transport(transport)
         connection = PebbleConnection(transport, **self._get_debug_args())
-        connection.connect()
-        connection.run_async()
-        handler_impl.post_connect(connection)
+        endpoint_stats.instrument(connection, ' '.join([handler_impl.name] + [str(x) for x in
+                                                                              handler_impl._connect_args(args) or ()
+                                                                              if x is not None]))
+        with profiling.phase("connection.connect", 'connect'):
+            connection.connect()
+        with profiling.phase("fetch_watch_info", 'connect'):
+            start_connection(connection)
+        with profiling.phase("post_connect", 'connect'):
+            handler_impl.post_connect(connection)
+        perf_history.record('connect', time.time() - start, platform=watch_platform(connection),
+                            transport=type(transport).__name__)
         return connection
 
     def _get_debug_args(self):
@@ -133,6 +281,14 @@ class PebbleCommand(BaseCommand):
         return args
 
 
+def watch_platform(connection):
+    """The platform of the connected watch or emulator, or None if we can't tell."""
+    try:
+        return connection.watch_platform
+    except Exception:
+        return None
+
+
 class SelfRegisteringTransportConfiguration(type):
     def __init__(cls, name, bases, dct):
         if hasattr(cls, 'name') and cls.name is not None:
@@ -141,6 +297,7 @@ class SelfRegisteringTransportConfiguration(type):
 
 
 class PebbleTransportConfiguration(with_metaclass(SelfRegisteringTransportConfiguration)):
+    # Dotted path to the transport class, so that libpebble2 isn't imported until we actually connect.
     transport_class = None
     env_var = None
     name = None
@@ -166,7 +323,9 @@ class PebbleTransportConfiguration(with_metaclass(SelfRegisteringTransportConfig
 
     @classmethod
     def get_transport(cls, args):
-        return cls.transport_class(*cls._connect_args(args))
+        module_name, class_name = cls.transport_class.rsplit('.', 1)
+        transport_class = getattr(importlib.import_module(module_name), class_name)
+        return transport_class(*cls._connect_args(args))
 
     @classmethod
     def add_argument_handler(cls):
@@ -178,7 +337,7 @@ class PebbleTransportConfiguration(with_metaclass(SelfRegisteringTransportConfig
 
 
 class PebbleTransportSerial(PebbleTransportConfiguration):
-    transport_class = SerialTransport
+    transport_class = 'libpebble2.communication.transports.serial.SerialTransport'
     env_var = 'PEBBLE_BT_SERIAL'
     name = 'serial'
 
@@ -188,7 +347,7 @@ class PebbleTransportSerial(PebbleTransportConfiguration):
 
 
 class PebbleTransportPhone(PebbleTransportConfiguration):
-    transport_class = WebsocketTransport
+    transport_class = 'libpebble2.communication.transports.websocket.WebsocketTransport'
     name = 'phone'
 
     @classmethod
@@ -211,7 +370,7 @@ class PebbleTransportPhone(PebbleTransportConfiguration):
 
 
 class PebbleTransportQemu(PebbleTransportConfiguration):
-    transport_class = QemuTransport
+    transport_class = 'libpebble2.communication.transports.qemu.QemuTransport'
     name = 'qemu'
 
     @classmethod
@@ -234,7 +393,7 @@ class PebbleTransportQemu(PebbleTransportConfiguration):
 
 
 class PebbleTransportCloudPebble(PebbleTransportConfiguration):
-    transport_class = CloudPebbleTransport
+    transport_class = 'pebble_tool.sdk.cloudpebble.CloudPebbleTransport'
     name = 'cloudpebble'
 
     @classmethod
@@ -250,11 +409,12 @@ class PebbleTransportCloudPebble(PebbleTransportConfiguration):
 
 
 class PebbleTransportEmulator(PebbleTransportConfiguration):
-    transport_class = ManagedEmulatorTransport
+    transport_class = 'pebble_tool.sdk.emulator.ManagedEmulatorTransport'
     name = 'emulator'
 
     @classmethod
     def get_running_emulators(cls):
+        from pebble_tool.sdk.emulator import ManagedEmulatorTransport, get_all_emulator_info
         running = []
         for platform, sdks in get_all_emulator_info().items():
             for sdk in sdks:
@@ -285,6 +445,7 @@ class PebbleTransportEmulator(PebbleTransportConfiguration):
 
     @classmethod
     def post_connect(cls, connection):
+        from libpebble2.protocol.system import TimeMessage, SetUTC
         # Make sure the timezone is set usefully.
         if connection.firmware_version.major >= 3:
             ts = time.time()
@@ -296,12 +457,109 @@ class PebbleTransportEmulator(PebbleTransportConfiguration):
     @classmethod
     def add_argument_handler(cls, parser):
         emu_group = parser.add_argument_group()
-        emu_group.add_argument('--emulator', type=str, help="Launch an emulator. Equivalent to PEBBLE_EMULATOR.",
-                           choices=pebble_platforms)
+        emu_group.add_argument('--emulator', type=_emulator_platforms, metavar='{{{}}}'.format(','.join(pebble_platforms)),
+                               help="Launch an emulator. Equivalent to PEBBLE_EMULATOR. Give several platforms, "
+                                    "separated by commas, to run on all of them in parallel.")
         emu_group.add_argument('--sdk', type=str, help="SDK version to launch. Defaults to the active SDK"
-                                                   " (currently {})".format(sdk_version()))
+                                                   " (currently {})".format(_active_sdk_for_help()))
+
+
+class PebbleTransportReplay(PebbleTransportConfiguration):
+    name = 'replay'
+    env_var = 'PEBBLE_REPLAY_TRANSPORT'
+
+    @classmethod
+    def get_transport(cls, args):
+        return transport_recording.replay_transport(cls._connect_args(args)[0])
 
-def register_children(parser):
+    @classmethod
+    def post_connect(cls, connection):
+        # Do whatever was done after connecting when the recording was made, so that we send the same messages.
+        for handler_impl in PebbleCommand.connection_handlers:
+            if handler_impl.name == connection.transport.handler_name and handler_impl is not cls:
+                handler_impl.post_connect(connection)
+
+    @classmethod
+    def add_argument_handler(cls, parser):
+        parser.add_argument('--replay-transport', dest='replay', metavar='file',
+                            help="Instead of connecting to anything, play back a recording made with "
+                                 "--record-transport. Equivalent to PEBBLE_REPLAY_TRANSPORT.")
+
+
+def _emulator_platforms(value):
+    for platform in value.split(','):
+        if platform not in pebble_platforms:
+            raise argparse.ArgumentTypeError("invalid choice: '{}' (choose from {})".format(
+                platform, ', '.join("'{}'".format(x) for x in pebble_platforms)))
+    return value
+
+
+_active_sdk = []
+
+
+def _active_sdk_for_help():
+    # This is called once per command when building the full parser; don't read the SDK manifest every time.
+    if not _active_sdk:
+        _active_sdk.append(sdk_version())
+    return _active_sdk[0]
+
+def selected_command(args):
+    """Returns the name of the command that will be run given the arguments to `pebble`, or None."""
+    return global_options.split(args)[1]
+
+
+def get_command_class(name):
+    if name in _LazyCommands:
+        importlib.import_module(_LazyCommands[name][0])
+    for cls in _CommandRegistry:
+        if cls.command == name:
+            return cls
+    return None
+
+
+def run_command_line(args):
+    """Runs the command given by `args` (the arguments to `pebble`) in this process, and returns its exit status."""
+    from pebble_tool import build_parser
+    parser, version_string = build_parser(args)
+    try:
+        parsed = parser.parse_args(args)
+        if not hasattr(parsed, 'func'):
+            parser.error("no subcommand specified.")
+        parsed.func(parsed)
+    except ToolError as e:
+        sys.stderr.write(u"{}\n".format(e))
+        return 1
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        sys.stderr.write("{}\n".format(e.code))
+        return 1
+    except Exception as e:
+        # Whatever went wrong (a watch that stopped answering, a dropped connection, a bug), it only fails this
+        # command, not the batch or daemon running it.
+        logger.debug("Command %s failed:", args, exc_info=True)
+        sys.stderr.write(u"{}: {}\n".format(type(e).__name__, e))
+        return 1
+    return 0
+
+
+def load_all_commands():
+    for module, summary in _LazyCommands.values():
+        importlib.import_module(module)
+
+
+def register_children(parser, args=None):
     subparsers = parser.add_subparsers(title="command")
-    for command in _CommandRegistry:
-        command.add_parser(subparsers)
+    command = selected_command(args or [])
+    if command in _LazyCommands:
+        importlib.import_module(_LazyCommands[command][0])
+    loaded = {cls.command: cls for cls in _CommandRegistry}
+    for name, (module, summary) in _LazyCommands.items():
+        if name in loaded:
+            loaded[name].add_parser(subparsers)
+        else:
+            # This command wasn't selected, so it's only here to appear in the help text.
+            subparsers.add_parser(name, help=summary, add_help=False)
+    for cls in _CommandRegistry:
+        if cls.command not in _LazyCommands:
+            cls.add_parser(subparsers)
@@ -0,0 +1,81 @@
+from __future__ import absolute_import, print_function
+
+import io
+import shlex
+import sys
+import time
+
+from .base import BaseCommand, ConnectionPool, PebbleCommand, run_command_line
+from pebble_tool.exceptions import ToolError
+
+
+class BatchCommand(BaseCommand):
+    """Runs a list of pebble commands, sharing connections between them."""
+    command = 'batch'
+
+    def __call__(self, args):
+        super(BatchCommand, self).__call__(args)
+        if args.file == '-':
+            lines = sys.stdin.readlines()
+        else:
+            try:
+                with io.open(args.file, encoding='utf-8') as f:
+                    lines = f.readlines()
+            except IOError as e:
+                raise ToolError("Couldn't read {}: {}".format(args.file, e.strerror))
+        steps = self._parse_lines(lines)
+
+        old_pool = PebbleCommand.connection_pool
+        pool = old_pool or ConnectionPool()
+        PebbleCommand.connection_pool = pool
+        ran = 0
+        failures = 0
+        start = time.time()
+        try:
+            for line_number, step in steps:
+                step_start = time.time()
+                status = run_command_line(step)
+                elapsed = time.time() - step_start
+                ran += 1
+                print("[line {}] {:.0f}ms {}: {}".format(line_number, elapsed * 1000, "ok" if status == 0 else "failed",
+                                                         ' '.join(step)), file=sys.stderr)
+                if status != 0:
+                    failures += 1
+                    if not args.keep_going:
+                        break
+        finally:
+            PebbleCommand.connection_pool = old_pool
+            if pool is not old_pool:
+                pool.close()
+        print("Ran {} of {} commands in {:.0f}ms.".format(ran, len(steps), (time.time() - start) * 1000), file=sys.stderr)
+        if failures:
+            raise ToolError("{} of {} commands failed.".format(failures, ran))
+
+    @staticmethod
+    def _parse_lines(lines):
+        steps = []
+        for line_number, line in enumerate(lines, 1):
+            # shlex in Python 2 can't handle unicode.
+            words = shlex.split(line.encode('utf-8') if isinstance(line, unicode) else line, comments=True)
+            if not words:
+                continue
+            if words[0] == 'pebble':
+                words = words[1:]
+            if words[:1] == ['batch']:
+                raise ToolError("Line {}: batches can't run other batches.".format(line_number))
+            steps.append((line_number, words))
+        return steps
+
+    @classmethod
+    def add_parser(cls, parser):
+        parser = super(BatchCommand, cls).add_parser(parser)
+        parser.add_argument('file', help="File to read commands from, one per line, or - to read them from stdin.")
+        parser.add_argument('--keep-going', action='store_true',
+                            help="Carry on running commands after one fails, instead of stopping.")
+        return parser
+
+    epilog = """
+Each line is an ordinary pebble command line, with or without the leading 'pebble'. Blank lines and anything following
+a # are ignored. Commands run one after another in this process, and commands that connect to the same watch or
+emulator share a single connection. The time each command took is printed to stderr.
+"""
@@ -0,0 +1,208 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import deque, OrderedDict
+import itertools
+import json
+import logging
+import random
+import time
+import uuid
+
+from libpebble2.exceptions import ConnectionError, ScreenshotError, TimeoutError
+from libpebble2.protocol.appmessage import AppMessage, AppMessagePush, AppMessageTuple
+from libpebble2.protocol.system import PingPong, Ping
+from libpebble2.protocol.transfers import PutBytes, PutBytesPut, PutBytesResponse
+from libpebble2.services.screenshot import Screenshot
+
+from .base import PebbleCommand, watch_platform
+from pebble_tool.exceptions import ToolError
+from pebble_tool.util.endpoint_stats import summarise_latencies
+from pebble_tool.util.futures import MatchedRequests
+
+# The most we'll put in one message: it's what libpebble2 sends PutBytes data in, and fits in the watch's buffers.
+MAX_PAYLOAD = 2000
+
+# App message transaction IDs are a byte, so this is as many as can be told apart.
+MAX_WINDOW = 255
+
+# Nothing is running with this UUID, so the watch refuses the app messages we send it without doing anything.
+NO_SUCH_APP = uuid.UUID('00000000-0000-0000-0000-0000000000be')
+
+
+class BenchCommand(PebbleCommand):
+    """Measures the latency and throughput of the connection to the watch."""
+    command = 'bench'
+
+    def __call__(self, args):
+        try:
+            sizes = sorted({int(x) for x in args.sizes.split(',') if x})
+        except ValueError:
+            raise ToolError("--sizes must be a comma-separated list of numbers of bytes.")
+        if not sizes or sizes[0] < 1 or sizes[-1] > MAX_PAYLOAD:
+            raise ToolError("Payload sizes must be between 1 and {} bytes.".format(MAX_PAYLOAD))
+        if args.rounds < 1 or args.window < 1 or args.screenshots < 1:
+            raise ToolError("--rounds, --window and --screenshots must be at least 1.")
+        if args.window > MAX_WINDOW:
+            raise ToolError("--window can't be more than {}.".format(MAX_WINDOW))
+        super(BenchCommand, self).__call__(args)
+
+        # QemuTransport warns whenever what it's read so far ends partway through a frame, which is routine when
+        # we're sending and receiving this fast.
+        protocol_logger = logging.getLogger('libpebble2.protocol')
+        log_level = protocol_logger.level
+        if not args.v:
+            protocol_logger.setLevel(logging.ERROR)
+        try:
+            results = OrderedDict()
+            results['transport'] = type(self.pebble.transport).__name__
+            results['platform'] = watch_platform(self.pebble)
+            results['latency'] = self._measure_latency(args)
+            results['upload'] = []
+            # Replies are matched to what we sent by cookie (PutBytes) or transaction ID (AppMessage).
+            for endpoint, make_packet, response, identify, identifiers in (
+                    ('PutBytes', self._put_bytes, PutBytesResponse, lambda message: message.cookie,
+                     lambda: itertools.count(random.randint(1, 0x7FFFFFFF))),
+                    ('AppMessage', self._app_message, AppMessage, lambda message: message.transaction_id,
+                     lambda: itertools.cycle(range(MAX_WINDOW + 1)))):
+                for size in sizes:
+                    results['upload'].append(self._measure_upload(endpoint, make_packet, response, identify,
+                                                                  identifiers(), size, args))
+            results['download'] = None if args.no_screenshot else self._measure_download(args)
+        except ConnectionError as e:
+            raise ToolError(str(e))
+        finally:
+            protocol_logger.setLevel(log_level)
+
+        if args.json:
+            print(json.dumps(results, indent=4))
+        else:
+            self._print_results(results)
+
+    def _measure_latency(self, args):
+        pongs = MatchedRequests(self.pebble, PingPong, lambda pong: pong.cookie)
+        times = []
+        try:
+            for i in range(args.rounds):
+                cookie = random.randint(1, 0xFFFFFFFF)
+                try:
+                    pong, rtt = pongs.request(PingPong(cookie=cookie, message=Ping(idle=False)),
+                                              cookie).result(args.timeout)
+                except TimeoutError:
+                    pass
+                else:
+                    times.append(rtt)
+        finally:
+            pongs.close()
+        return OrderedDict([('rounds', args.rounds), ('lost', args.rounds - len(times)),
+                            ('rtt_ms', summarise_latencies(times))])
+
+    @classmethod
+    def _put_bytes(cls, payload, cookie):
+        # There's no transfer with this cookie, so the watch refuses it without writing anything.
+        return PutBytes(command=0x02, data=PutBytesPut(cookie=cookie, payload_size=len(payload), payload=payload))
+
+    @classmethod
+    def _app_message(cls, payload, transaction_id):
+        tuples = [AppMessageTuple(key=0, type=AppMessageTuple.Type.ByteArray, data=payload)]
+        return AppMessage(command=0x01, transaction_id=transaction_id,
+                          data=AppMessagePush(uuid=NO_SUCH_APP, count=len(tuples), dictionary=tuples))
+
+    def _measure_upload(self, endpoint, make_packet, response, identify, identifiers, size, args):
+        """Sends messages carrying `size` bytes each, keeping up to --window of them waiting for a reply at once."""
+        count = max(1, args.bytes // size)
+        payload = b'\x55' * size
+        message_size = len(make_packet(payload, 0).serialise_packet())
+        replies = MatchedRequests(self.pebble, response, identify)
+        times = []
+        outstanding = deque()
+        start = time.time()
+        try:
+            for i in range(count + args.window):
+                if len(outstanding) == args.window or (i >= count and outstanding):
+                    try:
+                        reply, rtt = outstanding.popleft().result(args.timeout)
+                    except TimeoutError:
+                        pass
+                    else:
+                        times.append(rtt)
+                if i < count:
+                    identifier = next(identifiers)
+                    outstanding.append(replies.request(make_packet(payload, identifier), identifier))
+        finally:
+            replies.close()
+        elapsed = time.time() - start
+        return OrderedDict([
+            ('endpoint', endpoint),
+            ('payload_bytes', size),
+            ('message_bytes', message_size),
+            ('messages', count),
+            ('lost', count - len(times)),
+            ('seconds', elapsed),
+            ('bytes_per_second', len(times) * message_size / elapsed),
+            ('messages_per_second', len(times) / elapsed),
+            ('rtt_ms', summarise_latencies(times)),
+        ])
+
+    def _measure_download(self, args):
+        """Fetches screenshots, the largest thing the watch will send us on request."""
+        sizes = []
+        screenshot = Screenshot(self.pebble)
+        screenshot.register_handler("progress", lambda progress, total: sizes.append(total))
+        start = time.time()
+        try:
+            for i in range(args.screenshots):
+                screenshot.grab_image()
+        except ScreenshotError as e:
+            raise ToolError("Couldn't take a screenshot: {}".format(e))
+        elapsed = time.time() - start
+        total = sizes[-1] * args.screenshots if sizes else 0
+        return OrderedDict([
+            ('endpoint', 'Screenshot'),
+            ('screenshots', args.screenshots),
+            ('bytes', total),
+            ('seconds', elapsed),
+            ('bytes_per_second', total / elapsed),
+        ])
+
+    @classmethod
+    def _print_results(cls, results):
+        print("{} ({})".format(results['transport'], results['platform']))
+        latency = results['latency']
+        print("Ping: {} rounds, {} lost, {}".format(latency['rounds'], latency['lost'],
+                                                  cls._describe_rtt(latency['rtt_ms'])))
+        print("Upload:")
+        for result in results['upload']:
+            print("  {:<10} {:>5} bytes: {:>9.1f} KB/s {:>7.1f} msg/s, {} lost, {}".format(
+                result['endpoint'], result['payload_bytes'], result['bytes_per_second'] / 1024,
+                result['messages_per_second'], result['lost'], cls._describe_rtt(result['rtt_ms'])))
+        download = results['download']
+        if download is not None:
+            print("Download:")
+            print("  {:<10} {:>5} bytes: {:>9.1f} KB/s".format(download['endpoint'],
+                                                             download['bytes'] // max(1, download['screenshots']),
+                                                             download['bytes_per_second'] / 1024))
+
+    @classmethod
+    def _describe_rtt(cls, rtt):
+        if rtt is None:
+            return "no replies"
+        return "rtt min/avg/p50/p95/p99/max = {}ms".format('/'.join("{:.1f}".format(x) for x in rtt.values()))
+
+    @classmethod
+    def add_parser(cls, parser):
+        parser = super(BenchCommand, cls).add_parser(parser)
+        parser.add_argument('--rounds', type=int, default=50, help="Number of pings to time (default 50).")
+        parser.add_argument('--sizes', default='64,256,1024,2000',
+                            help="Comma-separated payload sizes, in bytes, to measure sending at (default "
+                                 "64,256,1024,2000).")
+        parser.add_argument('--bytes', type=int, default=32768,
+                            help="Roughly how many bytes of payload to send at each size (default 32768).")
+        parser.add_argument('--window', type=int, default=4,
+                            help="How many messages may be waiting for a reply at once (default 4).")
+        parser.add_argument('--screenshots', type=int, default=1,
+                            help="Number of screenshots to fetch when measuring download speed (default 1).")
+        parser.add_argument('--no-screenshot', action='store_true', help="Don't measure download speed.")
+        parser.add_argument('--timeout', type=float, default=5,
+                            help="Seconds to wait for each reply before counting it lost (default 5).")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+        return parser
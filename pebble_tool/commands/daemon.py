@@ -0,0 +1,226 @@
+from __future__ import absolute_import, print_function
+
+import errno
+import json
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+import traceback
+
+from .base import BaseCommand, ConnectionPool, PebbleCommand, get_command_class, run_command_line, selected_command
+from pebble_tool.exceptions import ToolError
+from pebble_tool.util import perf_history
+from pebble_tool.util.analytics import flush_analytics
+from pebble_tool.util.daemon import connect_to_daemon, daemon_socket_path, send_message
+from pebble_tool.util.waiting import clear_interrupt, interrupt_thread
+
+
+class _ClientStream(object):
+    """Stands in for sys.stdout or sys.stderr while running a command on behalf of a client."""
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def write(self, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'replace')
+        if text:
+            self.client.send({self.name: text})
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class _Client(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.stream = connection.makefile('rwb')
+        self.send_lock = threading.Lock()
+        self.finished = False
+        self.worker = None
+
+    def receive(self):
+        line = self.stream.readline()
+        if not line:
+            return None
+        return json.loads(line.decode('utf-8'))
+
+    def send(self, message):
+        with self.send_lock:
+            try:
+                send_message(self.stream, message)
+            except socket.error:
+                # The client went away; we'll find out about that in watch_for_hangup.
+                pass
+
+    def watch_for_hangup(self):
+        # Clients don't send anything after their request, so anything happening on the socket means they're gone
+        # (or want the command stopped, which is how ctrl-C is passed along). Either way, interrupt the command.
+        try:
+            self.connection.recv(1)
+        except socket.error:
+            pass
+        with self.send_lock:
+            if not self.finished:
+                interrupt_thread(self.worker)
+
+    def finish(self, message):
+        with self.send_lock:
+            self.finished = True
+        self.send(message)
+        self.connection.close()
+
+
+class PebbleDaemon(object):
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.run_lock = threading.Lock()
+        self.stop_read, self.stop_write = os.pipe()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def serve_forever(self):
+        # Anyone who can connect to the socket can run commands as us, so it mustn't be accessible to anyone else even
+        # briefly, as it would be between binding with the usual umask and changing its mode.
+        old_umask = os.umask(0o077)
+        try:
+            self.server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+        self.server.listen(5)
+        PebbleCommand.connection_pool = ConnectionPool()
+        try:
+            while True:
+                try:
+                    readable, _, _ = select.select([self.server, self.stop_read], [], [])
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if self.stop_read in readable:
+                    break
+                connection, _ = self.server.accept()
+                thread = threading.Thread(target=self._handle_client, args=(connection,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.server.close()
+            os.unlink(self.socket_path)
+            PebbleCommand.connection_pool.close()
+            PebbleCommand.connection_pool = None
+
+    def stop(self):
+        os.write(self.stop_write, b'x')
+
+    def _handle_client(self, connection):
+        client = _Client(connection)
+        request = client.receive()
+        if request is None:
+            connection.close()
+            return
+        if request.get('stop'):
+            client.finish({'exit': 0})
+            self.stop()
+            return
+        with self.run_lock:
+            client.worker = threading.current_thread().ident
+            watcher = threading.Thread(target=client.watch_for_hangup)
+            watcher.daemon = True
+            try:
+                command = get_command_class(selected_command(request['args']))
+                if command is None or not issubclass(command, PebbleCommand) or command.interactive:
+                    client.finish({'local': True})
+                    return
+                watcher.start()
+                status = self._run(client, request)
+            except KeyboardInterrupt:
+                status = 130
+            client.finish({'exit': status})
+            # In case the client hung up just as the command finished.
+            clear_interrupt(client.worker)
+            # We may be running for a long time, so don't leave the events until we exit.
+            flush_analytics()
+            perf_history.flush()
+
+    def _run(self, client, request):
+        old_cwd = os.getcwd()
+        old_environ = dict(os.environ)
+        old_streams = sys.stdout, sys.stderr
+        # Log messages (as from -v) go to the client too.
+        log_handlers = [(handler, handler.stream) for handler in logging.getLogger().handlers
+                        if isinstance(handler, logging.StreamHandler)
+                        and handler.stream in (sys.stderr, sys.__stderr__)]
+        try:
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            sys.stdout = _ClientStream(client, 'stdout')
+            sys.stderr = _ClientStream(client, 'stderr')
+            for handler, stream in log_handlers:
+                handler.stream = sys.stderr
+            try:
+                return run_command_line(request['args'])
+            except KeyboardInterrupt:
+                return 130
+            except Exception:
+                traceback.print_exc()
+                return 1
+        finally:
+            for handler, stream in log_handlers:
+                handler.stream = stream
+            sys.stdout, sys.stderr = old_streams
+            os.environ.clear()
+            os.environ.update(old_environ)
+            os.chdir(old_cwd)
+
+
+class DaemonCommand(BaseCommand):
+    """Keeps connections open in the background, and runs watch and emulator commands over them."""
+    command = 'daemon'
+
+    def __call__(self, args):
+        super(DaemonCommand, self).__call__(args)
+        s = connect_to_daemon()
+        if args.stop:
+            if s is None:
+                raise ToolError("No pebble daemon is running.")
+            send_message(s.makefile('wb'), {'stop': True})
+            s.recv(1)
+            s.close()
+            return
+        if s is not None:
+            s.close()
+            raise ToolError("A pebble daemon is already running.")
+
+        path = daemon_socket_path()
+        if os.path.exists(path):
+            # Left behind by a daemon that didn't get to clean up.
+            os.unlink(path)
+        daemon = PebbleDaemon(path)
+        print("Listening on {}. Other pebble commands will now run here; press ctrl-C to stop.".format(path))
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    @classmethod
+    def add_parser(cls, parser):
+        parser = super(DaemonCommand, cls).add_parser(parser)
+        parser.add_argument('--stop', action='store_true', help="Stop the running daemon.")
+        return parser
+
+    epilog = """
+While the daemon is running, commands that talk to a watch or emulator are sent to it instead of being run directly,
+and reuse the connections it already has open. Commands are run one at a time. Interactive commands (repl and gdb)
+and commands that don't need a connection still run directly. Set PEBBLE_NO_DAEMON to bypass the daemon.
+"""
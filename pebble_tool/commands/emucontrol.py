@@ -280,6 +280,7 @@ class EmuTimeFormatCommand(PebbleCommand):
 
 
 class EmuSetTimelinePeekCommand(PebbleCommand):
+    """Shows or hides the emulated timeline quick view."""
     command = 'emu-set-timeline-quick-view'
     valid_connections = {'qemu', 'emulator'}
 
@@ -295,6 +296,7 @@ class EmuSetTimelinePeekCommand(PebbleCommand):
 
 
 class EmuSetContentSizeCommand(PebbleCommand):
+    """Sets the emulated content size."""
     command = 'emu-set-content-size'
     valid_connections = {'qemu', 'emulator'}
 
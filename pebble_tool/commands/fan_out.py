@@ -0,0 +1,214 @@
+"""
+Runs a watch or emulator command against several targets at once (`--emulator aplite,basalt`, `--all-emulators` or
+`--group NAME`), and reports how it went on each.
+"""
+from __future__ import absolute_import, print_function
+
+import copy
+import sys
+import threading
+import traceback
+
+import six
+
+from pebble_tool.exceptions import ToolError
+from pebble_tool.sdk import pebble_platforms
+from pebble_tool.util.config import config
+from pebble_tool.util.futures import run_in_thread, wait
+from pebble_tool.util.waiting import clear_interrupt, interrupt_thread
+
+
+class Target(object):
+    def __init__(self, name, handler_name, value, sdk=None):
+        self.name = name
+        self.handler_name = handler_name
+        self.value = value
+        self.sdk = sdk
+
+    def apply(self, args, handler_names):
+        """Returns a copy of `args` that connects to this target and nothing else."""
+        args = copy.copy(args)
+        for name in handler_names:
+            setattr(args, name, None)
+        setattr(args, self.handler_name, self.value)
+        if self.handler_name == 'emulator':
+            args.sdk = self.sdk
+        args.all_emulators = False
+        args.group = None
+        return args
+
+
+def parse_target(spec):
+    """Parses a target from a device group, like 'emulator:basalt', 'qemu:localhost:12344' or 'phone:10.0.0.5'."""
+    handler_name, _, value = spec.partition(':')
+    if handler_name == 'emulator':
+        if value not in pebble_platforms:
+            raise ToolError("'{}' isn't a valid emulator platform (pick from {}).".format(value,
+                                                                                      ', '.join(pebble_platforms)))
+        return Target(value, 'emulator', value)
+    if handler_name == 'cloudpebble':
+        return Target(spec, 'cloudpebble', True)
+    if handler_name not in ('qemu', 'phone', 'serial') or not value:
+        raise ToolError("Don't know how to connect to '{}'.".format(spec))
+    return Target(spec, handler_name, value)
+
+
+def targets_for(command_class, args):
+    """Returns the targets `args` asks for, or None if it's just the usual single connection."""
+    handler_names = {handler.name for handler in command_class.valid_connection_handlers()}
+    if getattr(args, 'group', None):
+        groups = config.get('device-groups', {})
+        if args.group not in groups:
+            raise ToolError("There's no device group called '{}'. Groups are listed under 'device-groups' in {}."
+                            .format(args.group, config.path))
+        targets = [parse_target(spec) for spec in groups[args.group]]
+    elif getattr(args, 'all_emulators', False):
+        from .base import PebbleTransportEmulator
+        running = sorted(PebbleTransportEmulator.get_running_emulators())
+        if not running:
+            raise ToolError("No emulators are running.")
+        versions = {sdk for platform, sdk in running}
+        targets = [Target(platform if len(versions) == 1 else "{} ({})".format(platform, sdk), 'emulator', platform,
+                          sdk) for platform, sdk in running]
+    elif getattr(args, 'emulator', None) and ',' in args.emulator:
+        targets = [Target(platform, 'emulator', platform, args.sdk) for platform in args.emulator.split(',')]
+    else:
+        return None
+
+    for target in targets:
+        if target.handler_name not in handler_names:
+            raise ToolError("{} can't connect to {}.".format(command_class.command, target.name))
+    if command_class.interactive:
+        raise ToolError("{} can't be run on several targets at once.".format(command_class.command))
+    return targets
+
+
+def run_on_targets(command_class, args, targets):
+    """Runs the command against each target in parallel, prefixing its output with the target's name."""
+    handler_names = {handler.name for handler in command_class.connection_handlers}
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = _TargetStream(stdout)
+    sys.stderr = _TargetStream(stderr)
+    try:
+        futures = [run_in_thread(_run_target, command_class, target.apply(args, handler_names), target.name)
+                   for target in targets]
+        try:
+            wait(futures)
+        except KeyboardInterrupt:
+            # Pass ctrl-C on to every target, and give them the chance to stop cleanly.
+            for ident in list(_thread_targets):
+                interrupt_thread(ident)
+            wait(futures)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.stdout, sys.stderr = stdout, stderr
+
+    failures = 0
+    for target, future in zip(targets, futures):
+        error = future.exception()
+        if error is None:
+            print("{}: ok".format(target.name), file=sys.stderr)
+        elif isinstance(error, KeyboardInterrupt):
+            failures += 1
+            print("{}: interrupted".format(target.name), file=sys.stderr)
+        else:
+            failures += 1
+            print("{}: failed: {}".format(target.name, error), file=sys.stderr)
+    if failures:
+        raise ToolError("{} of {} targets failed.".format(failures, len(targets)))
+
+
+def _run_target(command_class, args, name):
+    _thread_targets[threading.current_thread().ident] = name
+    command = command_class()
+    command.target_name = name
+    try:
+        command(args)
+    except SystemExit as e:
+        if e.code:
+            raise ToolError("exited with status {}".format(e.code))
+    except (ToolError, KeyboardInterrupt):
+        raise
+    except Exception:
+        traceback.print_exc()
+        raise
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            if isinstance(stream, _TargetStream):
+                stream.finish_target(name)
+        ident = threading.current_thread().ident
+        del _thread_targets[ident]
+        # We may have been sent ctrl-C just as we finished.
+        clear_interrupt(ident)
+
+
+# Thread ident -> the name of the target that thread is working on.
+_thread_targets = {}
+
+
+def _current_target():
+    thread = threading.current_thread()
+    name = _thread_targets.get(thread.ident)
+    if name is None:
+        # Threads started on the target's behalf, like connections' reader threads, print things too.
+        name = _thread_targets.get(getattr(thread, 'parent_ident', None))
+    return name
+
+
+class _TargetStream(object):
+    """Stands in for sys.stdout or sys.stderr, and prefixes each line with the name of the target it came from."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.partial_lines = {}
+
+    def write(self, text):
+        name = _current_target()
+        if name is None:
+            self.stream.write(text)
+            return
+        if isinstance(text, bytes):
+            # Commands print both bytes and unicode; work in unicode so that they can be mixed on one line.
+            text = text.decode(self._encoding(), 'replace')
+        with self.lock:
+            lines = (self.partial_lines.pop(name, u'') + text).split(u'\n')
+            for line in lines[:-1]:
+                self._write(u"[{}] {}\n".format(name, self._last_redraw(line)))
+            if lines[-1]:
+                partial = self._last_redraw(lines[-1])
+                # Keep a trailing \r, so that whatever comes next still replaces what's there.
+                self.partial_lines[name] = partial + u'\r' if lines[-1].endswith(u'\r') else partial
+
+    @staticmethod
+    def _last_redraw(line):
+        # Progress bars redraw their line after a \r; only show where they ended up.
+        redraws = [x for x in line.split(u'\r') if x]
+        return redraws[-1] if redraws else u''
+
+    def _encoding(self):
+        return getattr(self.stream, 'encoding', None) or 'utf-8'
+
+    def _write(self, text):
+        if six.PY2:
+            # Python 2 files would encode unicode as ASCII (unless they're a terminal), which fails on anything else.
+            text = text.encode(self._encoding(), 'replace')
+        self.stream.write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.stream.flush()
+
+    def finish_target(self, name):
+        """Writes out whatever's left of the target's last line."""
+        with self.lock:
+            partial = self.partial_lines.pop(name, None)
+            if partial:
+                self._write(u"[{}] {}\n".format(name, self._last_redraw(partial)))
+        self.stream.flush()
+
+    def isatty(self):
+        return False
@@ -3,6 +3,8 @@ __author__ = 'katharine'
 
 import os
 import os.path
+import threading
+import time
 from progressbar import ProgressBar, Bar, FileTransferSpeed, Timer, Percentage
 
 from libpebble2.communication.transports.websocket import WebsocketTransport, MessageTargetPhone
@@ -10,9 +12,10 @@ from libpebble2.communication.transports.websocket.protocol import WebSocketInst
 from libpebble2.exceptions import TimeoutError
 from libpebble2.services.install import AppInstaller
 
-from .base import PebbleCommand
+from .base import PebbleCommand, watch_platform
 from ..util.logs import PebbleLogPrinter
 from ..exceptions import ToolError
+from ..util import perf_history, profiling
 
 
 class InstallCommand(PebbleCommand):
@@ -48,10 +51,18 @@ class ToolAppInstaller(object):
                                                  FileTransferSpeed(), ' ', Timer(format='%s')])
 
     def install(self):
-        if isinstance(self.pebble.transport, WebsocketTransport):
-            self._install_via_websocket(self.pebble, self.pbw)
-        else:
-            self._install_via_serial(self.pebble, self.pbw)
+        start = time.time()
+        succeeded = False
+        try:
+            with profiling.phase("install transfer", 'install', pbw=self.pbw):
+                if isinstance(self.pebble.transport, WebsocketTransport):
+                    self._install_via_websocket(self.pebble, self.pbw)
+                else:
+                    self._install_via_serial(self.pebble, self.pbw)
+            succeeded = True
+        finally:
+            perf_history.record('install', time.time() - start, succeeded=succeeded,
+                                platform=watch_platform(self.pebble), transport=type(self.pebble.transport).__name__)
 
     def _install_via_serial(self, pebble, pbw):
         installer = AppInstaller(pebble, pbw)
@@ -65,14 +76,30 @@ class ToolAppInstaller(object):
         self.progress_bar.update(total_sent)
 
     def _install_via_websocket(self, pebble, pbw):
-        with open(pbw) as f:
-            print("Installing app...")
-            pebble.transport.send_packet(WebSocketInstallBundle(pbw=f.read()), target=MessageTargetPhone())
-            try:
-                result = pebble.read_transport_message(MessageTargetPhone, WebSocketInstallStatus, timeout=300)
-            except TimeoutError:
-                raise ToolError("Timed out waiting for install confirmation.")
-            if result.status != WebSocketInstallStatus.StatusCode.Success:
-                raise ToolError("App install failed.")
-            else:
-                print("App install succeeded.")
+        pbw_content = _read_pbw(pbw)
+        print("Installing app...")
+        pebble.transport.send_packet(WebSocketInstallBundle(pbw=pbw_content), target=MessageTargetPhone())
+        try:
+            result = pebble.read_transport_message(MessageTargetPhone, WebSocketInstallStatus, timeout=300)
+        except TimeoutError:
+            raise ToolError("Timed out waiting for install confirmation.")
+        if result.status != WebSocketInstallStatus.StatusCode.Success:
+            raise ToolError("App install failed.")
+        else:
+            print("App install succeeded.")
+
+
+_pbw_cache = {}
+_pbw_cache_lock = threading.Lock()
+
+
+def _read_pbw(path):
+    # When installing on several targets at once, only read the pbw once.
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+        with _pbw_cache_lock:
+            if key not in _pbw_cache:
+                _pbw_cache.clear()
+                _pbw_cache[key] = f.read()
+            return _pbw_cache[key]
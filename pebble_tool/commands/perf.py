@@ -0,0 +1,161 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+import json
+import os
+import time
+
+from .base import BaseCommand
+from pebble_tool.exceptions import ToolError
+from pebble_tool.util import perf_history
+from pebble_tool.util.endpoint_stats import percentile
+from pebble_tool.util.versions import version_to_key
+
+
+def _median(values):
+    return percentile(sorted(values), 50)
+
+
+class PerfCommand(BaseCommand):
+    """Shows how long builds, installs, emulator boots, screenshots and connecting have been taking."""
+    command = 'perf'
+    has_subcommands = True
+
+    def __call__(self, args):
+        super(PerfCommand, self).__call__(args)
+        args.sub_func(args)
+
+    @classmethod
+    def add_parser(cls, parser):
+        parser = super(PerfCommand, cls).add_parser(parser)
+        subparsers = parser.add_subparsers(title="subcommand")
+
+        report_parser = subparsers.add_parser("report", help="Summarises the recorded timings.")
+        report_parser.add_argument('--kind', help="Only include this kind of measurement (build, install, "
+                                                  "emulator-boot, screenshot or connect).")
+        report_parser.add_argument('--project', help="Only include this project.")
+        report_parser.add_argument('--platform', help="Only include this platform.")
+        report_parser.add_argument('--days', type=int, default=90, help="How far back to look (default 90).")
+        report_parser.add_argument('--recent', type=int, default=10,
+                                   help="How many of the latest runs to compare against the rest when looking for "
+                                        "regressions (default 10).")
+        report_parser.add_argument('--threshold', type=float, default=20,
+                                   help="Slowdown, in percent, that counts as a regression (default 20).")
+        report_parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+        report_parser.set_defaults(sub_func=cls.do_report)
+
+        clear_parser = subparsers.add_parser("clear", help="Deletes the recorded timings.")
+        clear_parser.set_defaults(sub_func=cls.do_clear)
+        return parser
+
+    @classmethod
+    def do_report(cls, args):
+        groups = cls._load(args)
+        if not groups:
+            raise ToolError("No timings have been recorded yet.")
+        rows = [cls._summarise(key, measurements, args) for key, measurements in groups.items()]
+        sdk_changes = cls._sdk_changes(groups, args.threshold)
+        if args.json:
+            print(json.dumps({'groups': rows, 'sdk_changes': sdk_changes}, indent=4))
+            return
+
+        print("{:<14} {:<20} {:<8} {:<8} {:>5} {:>9} {:>9} {:>9} {:>8}".format(
+            "kind", "project", "platform", "sdk", "runs", "p50 (s)", "p95 (s)", "max (s)", "trend"))
+        for row in rows:
+            trend = "{:+.0f}%".format(row['trend']) if row['trend'] is not None else "-"
+            print("{:<14} {:<20} {:<8} {:<8} {:>5} {:>9.2f} {:>9.2f} {:>9.2f} {:>8}{}".format(
+                row['kind'], row['project'] or '-', row['platform'] or '-', row['sdk_version'] or '-', row['runs'],
+                row['p50'], row['p95'], row['max'], trend, "  REGRESSION" if row['regression'] else ""))
+        if sdk_changes:
+            print()
+            print("Changes between SDK versions (median):")
+            for change in sdk_changes:
+                print("  {} {} {}: {:.2f}s on {} -> {:.2f}s on {} ({:+.0f}%){}".format(
+                    change['kind'], change['project'] or '-', change['platform'] or '-', change['old_median'],
+                    change['old_sdk'], change['new_median'], change['new_sdk'], change['change'],
+                    "  REGRESSION" if change['regression'] else ""))
+
+    @classmethod
+    def _load(cls, args):
+        if not os.path.exists(perf_history.database_path()):
+            return {}
+        query = "SELECT kind, project, platform, sdk_version, duration FROM measurements WHERE timestamp >= ? " \
+                "AND succeeded = 1"
+        params = [time.time() - args.days * 86400]
+        for column in ('kind', 'project', 'platform'):
+            if getattr(args, column) is not None:
+                query += " AND {} = ?".format(column)
+                params.append(getattr(args, column))
+        query += " ORDER BY kind, project, platform, sdk_version, timestamp"
+        db = perf_history.connect()
+        try:
+            groups = OrderedDict()
+            for kind, project, platform, sdk, duration in db.execute(query, params):
+                groups.setdefault((kind, project, platform, sdk), []).append(duration)
+        finally:
+            db.close()
+        return groups
+
+    @classmethod
+    def _summarise(cls, key, durations, args):
+        kind, project, platform, sdk = key
+        ordered = sorted(durations)
+        # Compare the latest runs against everything before them.
+        trend = None
+        if len(durations) > args.recent:
+            earlier = _median(durations[:-args.recent])
+            if earlier > 0:
+                trend = (_median(durations[-args.recent:]) - earlier) / earlier * 100
+        return {
+            'kind': kind,
+            'project': project,
+            'platform': platform,
+            'sdk_version': sdk,
+            'runs': len(durations),
+            'p50': percentile(ordered, 50),
+            'p90': percentile(ordered, 90),
+            'p95': percentile(ordered, 95),
+            'p99': percentile(ordered, 99),
+            'min': ordered[0],
+            'max': ordered[-1],
+            'trend': trend,
+            'regression': trend is not None and trend > args.threshold,
+        }
+
+    @classmethod
+    def _sdk_changes(cls, groups, threshold):
+        by_sdk = OrderedDict()
+        for (kind, project, platform, sdk), durations in groups.items():
+            if sdk is not None:
+                by_sdk.setdefault((kind, project, platform), {})[sdk] = _median(durations)
+        changes = []
+        for (kind, project, platform), medians in by_sdk.items():
+            versions = sorted(medians, key=version_to_key)
+            for old_sdk, new_sdk in zip(versions, versions[1:]):
+                if medians[old_sdk] <= 0:
+                    continue
+                change = (medians[new_sdk] - medians[old_sdk]) / medians[old_sdk] * 100
+                changes.append({
+                    'kind': kind,
+                    'project': project,
+                    'platform': platform,
+                    'old_sdk': old_sdk,
+                    'new_sdk': new_sdk,
+                    'old_median': medians[old_sdk],
+                    'new_median': medians[new_sdk],
+                    'change': change,
+                    'regression': change > threshold,
+                })
+        return changes
+
+    @classmethod
+    def do_clear(cls, args):
+        path = perf_history.database_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        print("Deleted recorded timings.")
+
+    epilog = """
+Timings are recorded on this machine every time you build, install, take a screenshot, boot an emulator or connect to
+a watch, and are kept for a year. They are never sent anywhere. Only successful runs are included in reports.
+"""
@@ -1,11 +1,22 @@
-from __future__ import absolute_import, print_function
+from __future__ import absolute_import, division, print_function
 __author__ = 'katharine'
 
+from collections import deque, OrderedDict
+import itertools
+import json
 import random
+import time
 
+from libpebble2.exceptions import ConnectionError, TimeoutError
 from libpebble2.protocol.system import PingPong, Ping, Pong
 
 from .base import PebbleCommand
+from pebble_tool.exceptions import ToolError
+from pebble_tool.util.endpoint_stats import summarise_latencies
+from pebble_tool.util.futures import MatchedRequests
+
+# How many pings --flood keeps waiting for a pong at once.
+FLOOD_WINDOW = 8
 
 
 class PingCommand(PebbleCommand):
@@ -13,10 +24,103 @@ class PingCommand(PebbleCommand):
     command = 'ping'
 
     def __call__(self, args):
+        if args.count < 0 or args.interval < 0:
+            raise ToolError("--count and --interval can't be negative.")
         super(PingCommand, self).__call__(args)
-        cookie = random.randint(1, 0xFFFFFFFF)
-        pong = self.pebble.send_and_read(PingPong(cookie=cookie, message=Ping(idle=False)), PingPong)
-        if pong.cookie == cookie:
+        single = args.count == 1 and not args.flood and not args.json
+        pongs = MatchedRequests(self.pebble, PingPong, lambda pong: pong.cookie,
+                                on_unmatched=None if args.json or args.flood else self._unmatched_pong)
+        try:
+            results = self._ping(pongs, args)
+        except ConnectionError as e:
+            raise ToolError(str(e))
+        finally:
+            pongs.close()
+
+        if args.json:
+            print(json.dumps(results, indent=4))
+        elif single:
+            if results['received'] == 0:
+                raise ToolError("Timed out waiting for a pong.")
             print("Pong!")
         else:
-            print("Got wrong cookie: {} (expected {})".format(pong.cookie, cookie))
+            self._print_summary(results)
+
+    @classmethod
+    def _unmatched_pong(cls, pong):
+        print("Got a pong with a cookie we didn't send: {}".format(pong.cookie))
+
+    def _ping(self, pongs, args):
+        """Sends pings until we've sent --count of them or are interrupted, and summarises how they went."""
+        window = FLOOD_WINDOW if args.flood else 1
+        verbose = args.count != 1 and not args.flood and not args.json
+        times = []
+        sent = 0
+        outstanding = deque()  # (sequence number, future)
+        start = time.time()
+        sequence = itertools.count(1) if args.count == 0 else iter(range(1, args.count + 1))
+        try:
+            while True:
+                number = next(sequence, None)
+                if outstanding and (len(outstanding) == window or number is None):
+                    number_waited, future = outstanding.popleft()
+                    try:
+                        pong, rtt = future.result(args.timeout)
+                    except TimeoutError:
+                        if verbose:
+                            print("Ping {}: timed out".format(number_waited))
+                    else:
+                        times.append(rtt)
+                        if verbose:
+                            print("Pong {}: {:.1f}ms".format(number_waited, rtt * 1000))
+                if number is None:
+                    if not outstanding:
+                        break
+                    continue
+                if not args.flood and number > 1:
+                    # Keep to the interval, however long the last pong took.
+                    time.sleep(max(0, start + (number - 1) * args.interval - time.time()))
+                cookie = random.randint(1, 0xFFFFFFFF)
+                packet = PingPong(cookie=cookie, message=Ping(idle=args.payload_idle))
+                outstanding.append((number, pongs.request(packet, cookie)))
+                sent += 1
+        except KeyboardInterrupt:
+            # Like ping(8), stopping early still gets you a summary; anything still on its way back counts as lost.
+            pass
+        return OrderedDict([
+            ('sent', sent),
+            ('received', len(times)),
+            ('late', pongs.late),
+            ('lost', sent - len(times) - pongs.late),
+            ('mismatched', pongs.unmatched),
+            ('seconds', time.time() - start),
+            ('rtt_ms', summarise_latencies(times)),
+        ])
+
+    @classmethod
+    def _print_summary(cls, results):
+        print("{} pings sent, {} pongs received, {} late, {} lost, {} with a cookie we didn't send, in {:.1f}s".format(
+            results['sent'], results['received'], results['late'], results['lost'], results['mismatched'],
+            results['seconds']))
+        if results['rtt_ms'] is not None:
+            print("rtt min/avg/p50/p95/p99/max = {}ms".format(
+                '/'.join("{:.1f}".format(x) for x in results['rtt_ms'].values())))
+
+    @classmethod
+    def add_parser(cls, parser):
+        parser = super(PingCommand, cls).add_parser(parser)
+        parser.add_argument('-c', '--count', type=int, default=1,
+                            help="Number of pings to send, or 0 to keep going until interrupted (default 1).")
+        parser.add_argument('-i', '--interval', type=float, default=1,
+                            help="Seconds between sending each ping (default 1).")
+        parser.add_argument('-f', '--flood', action='store_true',
+                            help="Send pings as fast as the watch answers them, with up to {} waiting at once, "
+                                 "instead of waiting --interval between them.".format(FLOOD_WINDOW))
+        parser.add_argument('--payload-idle', action='store_true',
+                            help="Mark the pings as idle, as phones do to keep the connection alive, rather than as "
+                                 "user requests.")
+        parser.add_argument('--timeout', type=float, default=5,
+                            help="Seconds to wait for each pong before giving up on it (default 5). Pongs that "
+                                 "arrive after that are counted as late.")
+        parser.add_argument('--json', action='store_true', help="Print a summary of the results as JSON.")
+        return parser
@@ -8,17 +8,20 @@ import rlcompleter
 import libpebble2.protocol
 
 from .base import PebbleCommand
+from pebble_tool.util import endpoint_stats
 
 
 class ReplCommand(PebbleCommand):
     """Launches a python prompt with a 'pebble' object already connected."""
     command = 'repl'
+    interactive = True
 
     def __call__(self, args):
         super(ReplCommand, self).__call__(args)
         repl_env = {
             'pebble': self.pebble,
             'protocol': libpebble2.protocol,
+            'stats': endpoint_stats.stats_for(self.pebble),
         }
         readline.set_completer(rlcompleter.Completer(repl_env).complete)
         readline.parse_and_bind('tab:complete')
@@ -7,15 +7,18 @@ import datetime
 import itertools
 import png
 import os.path
+import re
 from progressbar import ProgressBar, Bar, ReverseBar, FileTransferSpeed, Timer, Percentage
 import subprocess
 import sys
+import time
 
 from libpebble2.exceptions import ScreenshotError
 from libpebble2.services.screenshot import Screenshot
 
-from .base import PebbleCommand
+from .base import PebbleCommand, watch_platform
 from pebble_tool.exceptions import ToolError
+from pebble_tool.util import perf_history, profiling
 
 
 class ScreenshotCommand(PebbleCommand):
@@ -29,25 +32,35 @@ class ScreenshotCommand(PebbleCommand):
 
     def __call__(self, args):
         super(ScreenshotCommand, self).__call__(args)
+        start = time.time()
         screenshot = Screenshot(self.pebble)
         screenshot.register_handler("progress", self._handle_progress)
 
         self.progress_bar.start()
         try:
-            image = screenshot.grab_image()
+            with profiling.phase("screenshot transfer", 'screenshot'):
+                image = screenshot.grab_image()
         except ScreenshotError as e:
             if self.pebble.firmware_version.major == 3 and self.pebble.firmware_version.minor == 2:
                 # PBL-21154: Screenshots failing with error code 2 (out of memory)
                 raise ToolError(str(e) + " (screenshots are known to be broken using firmware 3.2; try the emulator.)")
             else:
                 raise ToolError(str(e) + " (try rebooting the watch)")
-        if not args.no_correction:
-            image = self._correct_colours(image)
-        image = self._roundify(image)
+        with profiling.phase("screenshot processing", 'screenshot'):
+            if not args.no_correction:
+                image = self._correct_colours(image)
+            image = self._roundify(image)
         self.progress_bar.finish()
 
         filename = self._generate_filename() if args.filename is None else args.filename
-        png.from_array(image, mode='RGBA;8').save(filename)
+        if self.target_name is not None:
+            # Don't let the screenshots from each target overwrite each other.
+            root, ext = os.path.splitext(filename)
+            filename = "{}_{}{}".format(root, re.sub(r'[^\w.-]+', '_', self.target_name).strip('_'), ext)
+        with profiling.phase("screenshot save", 'screenshot'):
+            png.from_array(image, mode='RGBA;8').save(filename)
+        perf_history.record('screenshot', time.time() - start, platform=watch_platform(self.pebble),
+                            transport=type(self.pebble.transport).__name__)
         print("Saved screenshot to {}".format(filename))
         if not args.no_open:
             self._open(os.path.abspath(filename))
@@ -7,6 +7,7 @@ import logging
 
 from pebble_tool.exceptions import ToolError, MissingSDK
 from pebble_tool.sdk import add_tools_to_path, sdk_path, sdk_manager
+from pebble_tool.util import probe_cache
 from ..base import BaseCommand
 
 logger = logging.getLogger("pebble_tool.commands.sdk")
@@ -33,15 +34,15 @@ class SDKCommand(BaseCommand):
     def _fix_python(self):
         # First figure out what 'python' means:
         try:
-            version = int(subprocess.check_output(["python", "-c", "import sys; print(sys.version_info[0])"]).strip())
-        except (subprocess.CalledProcessError, ValueError):
+            version = int(probe_cache.check_output(["python", "-c", "import sys; print(sys.version_info[0])"]).strip())
+        except (subprocess.CalledProcessError, OSError, ValueError):
             raise ToolError("'python' doesn't mean anything on this system.")
 
         if version != 2:
             try:
-                python2_version = int(subprocess.check_output(["python2", "-c",
-                                                                "import sys; print(sys.version_info[1])"]).strip())
-            except (subprocess.CalledProcessError, ValueError):
+                python2_version = int(probe_cache.check_output(["python2", "-c",
+                                                                 "import sys; print(sys.version_info[1])"]).strip())
+            except (subprocess.CalledProcessError, OSError, ValueError):
                 raise ToolError("Can't find a python2 interpreter.")
             if python2_version < 6:
                 raise ToolError("Require python 2.6 or 2.7 to run the build tools; got 2.{}".format(python2_version))
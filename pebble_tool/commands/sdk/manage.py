@@ -4,7 +4,6 @@ __author__ = "katharine"
 import collections
 import os
 import re
-import requests
 import shutil
 
 from ..base import BaseCommand
@@ -59,6 +58,7 @@ class SDKManager(BaseCommand):
 
     @classmethod
     def do_list(cls, args):
+        import requests
         current_sdk = sdk_manager.get_current_sdk()
         local_sdks = sdk_manager.list_local_sdks()
         local_sdk_versions = sdk_manager.list_local_sdk_versions()
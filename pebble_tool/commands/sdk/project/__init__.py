@@ -8,6 +8,7 @@ import logging
 from pebble_tool.exceptions import (PebbleProjectException, InvalidJSONException, InvalidProjectException,
                                     OutdatedProjectException)
 from pebble_tool.sdk.project import PebbleProject
+from pebble_tool.util import profiling
 from pebble_tool.util.analytics import post_event
 from pebble_tool.commands.sdk import SDKCommand
 
@@ -37,7 +38,8 @@ class SDKProjectCommand(SDKCommand):
         env['NOCLIMB'] = "1"  # This prevents waf from climbing into parent directories and executing commands
         if extra_env is not None:
             env.update(extra_env)
-        subprocess.check_call(command, env=env)
+        with profiling.phase("waf {}".format(command[2]), 'subprocess'):
+            subprocess.check_call(command, env=env)
 
     def __call__(self, args):
         super(SDKProjectCommand, self).__call__(args)
@@ -7,6 +7,7 @@ import subprocess
 import time
 
 from pebble_tool.exceptions import BuildError
+from pebble_tool.util import perf_history
 from pebble_tool.util.analytics import post_event
 import pebble_tool.util.npm as npm
 from pebble_tool.commands.sdk.project import SDKProjectCommand
@@ -41,11 +42,13 @@ class BuildCommand(SDKProjectCommand):
         except subprocess.CalledProcessError:
             duration = time.time() - start_time
             post_event("app_build_failed", build_time=duration)
+            perf_history.record('build', duration, succeeded=False)
             raise BuildError("Build failed.")
         else:
             duration = time.time() - start_time
             has_js = os.path.exists(os.path.join('src', 'js'))
             post_event("app_build_succeeded", has_js=has_js, line_counts=self._get_line_counts(), build_time=duration)
+            perf_history.record('build', duration)
 
     @classmethod
     def _get_line_counts(cls):
@@ -83,6 +86,7 @@ class BuildCommand(SDKProjectCommand):
 
 
 class CleanCommand(SDKProjectCommand):
+    """Deletes everything the current project's builds have produced."""
     command = "clean"
 
     def __call__(self, args):
@@ -23,6 +23,7 @@ class GdbCommand(PebbleCommand):
     """Connects a debugger to the current app. Only works in the emulator."""
     command = 'gdb'
     valid_connections = {'emulator'}
+    interactive = True
 
     @staticmethod
     def _find_app_section_offsets(app_elf_path):
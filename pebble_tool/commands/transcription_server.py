@@ -1,7 +1,6 @@
 __author__ = 'andrews'
 
 from enum import IntEnum
-from time import sleep
 import threading
 import re
 import logging
@@ -9,6 +8,7 @@ import logging
 from libpebble2.services.voice import *
 
 from .base import PebbleCommand
+from pebble_tool.util.waiting import Waiter
 
 logger = logging.getLogger("pebble_tool.commands.transcription_server")
 
@@ -20,7 +20,7 @@ mapping = {
 
 
 class TranscriptionServer(PebbleCommand):
-    ''' Starts a voice server listening for voice transcription requests from the app '''
+    """Starts a voice server listening for voice transcription requests from the app"""
     command = 'transcribe'
 
     def _send_result(self):
@@ -74,11 +74,14 @@ class TranscriptionServer(PebbleCommand):
 
         logger.debug("Transcription server listening")
 
-        try:
-            while True:
-                    sleep(1)
-        except KeyboardInterrupt:
-            return
+        with Waiter() as waiter:
+            waiter.watch_connection(self.pebble)
+            try:
+                waiter.wait()
+            except KeyboardInterrupt:
+                pass
+        if self._timer is not None:
+            self._timer.cancel()
 
     @classmethod
     def add_parser(cls, parser):
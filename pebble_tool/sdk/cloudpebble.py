@@ -27,6 +27,8 @@ class CloudPebbleTransport(WebsocketTransport):
         account = get_default_account()
         if not account.is_logged_in:
             raise ToolError("You must be logged in ('pebble login') to use the CloudPebble connection.")
+        # We'll need an access token once we're connected; if ours needs refreshing, do that while we connect.
+        account.refresh_if_expiring()
         self.ws = websocket.create_connection(CP_TRANSPORT_HOST)
         self._authenticate()
         self._wait_for_phone()
@@ -5,6 +5,7 @@ from six.moves import range
 from six import iteritems
 
 import bz2
+from collections import deque
 import errno
 import json
 import logging
@@ -17,18 +18,22 @@ import socket
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 
 from libpebble2.communication.transports.websocket import WebsocketTransport
 from libpebble2.exceptions import ConnectionError
 
-from pebble_tool.account import get_default_account
 from pebble_tool.exceptions import MissingEmulatorError, ToolError
+from pebble_tool.util import perf_history, profiling
 from pebble_tool.util.analytics import post_event
 from . import sdk_path, get_sdk_persist_dir, sdk_manager
 
 logger = logging.getLogger("pebble_tool.sdk.emulator")
 black_hole = open(os.devnull, 'w')
+_emulator_info_lock = threading.Lock()
+_chosen_ports = deque(maxlen=256)  # recently chosen, so possibly not yet listened on
+_chosen_ports_lock = threading.Lock()
 
 
 def get_emulator_info_path():
@@ -73,18 +78,20 @@ def get_emulator_info(platform, version=None):
 
 
 def update_emulator_info(platform, version, new_content):
-    try:
-        with open(get_emulator_info_path()) as f:
-            content = json.load(f)
-    except (OSError, IOError):
-        content = {}
+    # Several emulators may be starting at once, each updating the file.
+    with _emulator_info_lock:
+        try:
+            with open(get_emulator_info_path()) as f:
+                content = json.load(f)
+        except (OSError, IOError):
+            content = {}
 
-    if new_content is None:
-        del content.get(platform, {version: None})[version]
-    else:
-        content.setdefault(platform, {})[version] = new_content
-    with open(get_emulator_info_path(), 'w') as f:
-        json.dump(content, f, indent=4)
+        if new_content is None:
+            del content.get(platform, {version: None})[version]
+        else:
+            content.setdefault(platform, {})[version] = new_content
+        with open(get_emulator_info_path(), 'w') as f:
+            json.dump(content, f, indent=4)
 
 
 class ManagedEmulatorTransport(WebsocketTransport):
@@ -95,7 +102,10 @@ class ManagedEmulatorTransport(WebsocketTransport):
         super(ManagedEmulatorTransport, self).__init__('ws://localhost:{}/'.format(self.pypkjs_port))
 
     def connect(self):
-        self._spawn_processes()
+        start = time.time()
+        booting = self.qemu_pid is None
+        with profiling.phase("_spawn_processes", 'emulator'):
+            self._spawn_processes()
         for i in range(10):
             time.sleep(0.5)
             try:
@@ -103,8 +113,11 @@ class ManagedEmulatorTransport(WebsocketTransport):
             except ConnectionError:
                 continue
             else:
-                return
-        super(ManagedEmulatorTransport, self).connect()
+                break
+        else:
+            super(ManagedEmulatorTransport, self).connect()
+        if booting:
+            perf_history.record('emulator-boot', time.time() - start, platform=self.platform, sdk=self.version)
 
     def _find_ports(self):
         info = get_emulator_info(self.platform, self.version)
@@ -146,6 +159,10 @@ class ManagedEmulatorTransport(WebsocketTransport):
         if self.version is None:
             sdk_path()  # Force an SDK to be installed.
             self.version = sdk_manager.get_current_sdk()
+        if self.pypkjs_pid is None:
+            # pypkjs will need an access token; if ours needs refreshing, do that while QEMU boots.
+            from pebble_tool.account import get_default_account
+            get_default_account().refresh_if_expiring()
         if self.qemu_pid is None:
             logger.info("Spawning QEMU.")
             self._spawn_qemu()
@@ -177,6 +194,7 @@ class ManagedEmulatorTransport(WebsocketTransport):
         update_emulator_info(self.platform, self.version, d)
 
 
+    @profiling.timed("_spawn_qemu", 'emulator')
     def _spawn_qemu(self):
         qemu_bin = os.environ.get('PEBBLE_QEMU_PATH', 'qemu-pebble')
         qemu_micro_flash = os.path.join(sdk_manager.path_for_sdk(self.version), 'pebble', self.platform, 'qemu',
@@ -237,6 +255,7 @@ class ManagedEmulatorTransport(WebsocketTransport):
         self.qemu_pid = process.pid
         self._wait_for_qemu()
 
+    @profiling.timed("_wait_for_qemu", 'emulator')
     def _wait_for_qemu(self):
         logger.info("Waiting for the firmware to boot.")
         for i in range(20):
@@ -298,7 +317,9 @@ class ManagedEmulatorTransport(WebsocketTransport):
             self._copy_spi_image(path)
         return path
 
+    @profiling.timed("_spawn_pypkjs", 'emulator')
     def _spawn_pypkjs(self):
+        from pebble_tool.account import get_default_account
         phonesim_bin = os.environ.get('PHONESIM_PATH', 'phonesim.py')
         layout_file = os.path.join(sdk_manager.path_for_sdk(self.version), 'pebble', self.platform, 'qemu',
                                    "layouts.json")
@@ -336,11 +357,18 @@ class ManagedEmulatorTransport(WebsocketTransport):
 
     @classmethod
     def _choose_port(cls):
-        sock = socket.socket()
-        sock.bind(('', 0))
-        port = sock.getsockname()[1]
-        sock.close()
-        return port
+        # The OS can give a port it's just given us to the next caller as soon as we close it. Emulators launched in
+        # parallel (`--emulator aplite,basalt`) all choose their ports before any of them is listening, so make sure
+        # we don't hand out the same one twice.
+        with _chosen_ports_lock:
+            while True:
+                sock = socket.socket()
+                sock.bind(('', 0))
+                port = sock.getsockname()[1]
+                sock.close()
+                if port not in _chosen_ports:
+                    _chosen_ports.append(port)
+                    return port
 
     @classmethod
     def _is_pid_running(cls, pid):
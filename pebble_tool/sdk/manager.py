@@ -6,8 +6,6 @@ from distutils.util import strtobool
 import errno
 import json
 import os
-from progressbar import ProgressBar, Percentage, Bar, FileTransferSpeed, Timer
-import requests
 import shutil
 import subprocess
 import sys
@@ -15,7 +13,6 @@ import tempfile
 import tarfile
 
 from pebble_tool.exceptions import SDKInstallError, MissingSDK
-from pebble_tool.sdk.requirements import Requirements
 from pebble_tool.util import get_persist_dir
 from pebble_tool.util.config import config
 from pebble_tool.util.npm import invoke_npm
@@ -31,12 +28,63 @@ class SDKManager(object):
         self.sdk_dir = os.path.normpath(sdk_dir or os.path.join(get_persist_dir(), "SDKs"))
         if not os.path.exists(self.sdk_dir):
             os.makedirs(self.sdk_dir)
+        self._index = None
 
-    def list_local_sdks(self):
+    @property
+    def _index_path(self):
+        # This can't live in sdk_dir, or writing it would invalidate it.
+        return os.path.join(os.path.dirname(self.sdk_dir), "sdk-index.json")
+
+    def _get_index(self):
+        """
+        Returns the installed SDKs' manifests and the current SDK, as recorded in the index. Installing, uninstalling
+        or switching SDKs all change the mtime of sdk_dir, which is what we use to tell whether the index is stale.
+        """
+        try:
+            mtime = os.stat(self.sdk_dir).st_mtime
+        except OSError:
+            mtime = None
+        if self._index is not None and self._index['mtime'] == mtime:
+            return self._index
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            pass
+        else:
+            if index.get('sdk_dir') == self.sdk_dir and index.get('mtime') == mtime:
+                self._index = index
+                return index
+        return self._rebuild_index()
+
+    def _rebuild_index(self):
+        try:
+            mtime = os.stat(self.sdk_dir).st_mtime
+        except OSError:
+            mtime = None
+        current_path = self._scan_current_path()
+        index = {
+            'sdk_dir': self.sdk_dir,
+            'mtime': mtime,
+            'sdks': self._scan_local_sdks(),
+            'current_path': current_path,
+            'current_version': self._scan_current_sdk(current_path),
+        }
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._index_path), prefix='.sdk-index')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+            os.rename(temp_path, self._index_path)
+        except (IOError, OSError):
+            pass
+        self._index = index
+        return index
+
+    def _scan_local_sdks(self):
         sdks = []
         try:
-            for dir in os.listdir(self.sdk_dir):
-                dir = os.path.join(self.sdk_dir, dir)
+            for name in os.listdir(self.sdk_dir):
+                dir = os.path.join(self.sdk_dir, name)
                 if os.path.islink(dir):
                     continue
                 manifest_path = os.path.join(dir, 'sdk-core', 'manifest.json')
@@ -44,7 +92,7 @@ class SDKManager(object):
                     continue
                 with open(manifest_path) as f:
                     try:
-                        sdks.append(json.load(f))
+                        sdks.append([name, json.load(f)])
                     except ValueError:
                         pass
         except OSError as e:
@@ -54,6 +102,24 @@ class SDKManager(object):
 
         return sdks
 
+    def _scan_current_path(self):
+        path = self._current_path
+        if not os.path.exists(path):
+            return None
+        return os.path.join(path, 'sdk-core')
+
+    def _scan_current_sdk(self, current_path):
+        if current_path is None:
+            return None
+        manifest_path = os.path.join(current_path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            return json.load(f)['version']
+
+    def list_local_sdks(self):
+        return [manifest for name, manifest in self._get_index()['sdks']]
+
     def list_local_sdk_versions(self):
         return {x['version'] for x in self.list_local_sdks()}
 
@@ -70,8 +136,11 @@ class SDKManager(object):
                 self.set_current_sdk(current_sdks[0])
             else:
                 os.unlink(self._current_path)
+        self._rebuild_index()
 
     def install_from_url(self, url):
+        from progressbar import ProgressBar, Percentage, Bar, FileTransferSpeed, Timer
+        import requests
         print("Downloading...")
         bar = ProgressBar(widgets=[Percentage(), Bar(marker='=', left='[', right=']'), ' ', FileTransferSpeed(), ' ',
                                    Timer(format='%s')])
@@ -93,6 +162,7 @@ class SDKManager(object):
             self._install_from_handle(f)
 
     def _install_from_handle(self, f):
+        from pebble_tool.sdk.requirements import Requirements
         path = None
         try:
             print("Extracting...")
@@ -137,9 +207,11 @@ class SDKManager(object):
                     print("Done.")
             except OSError:
                 print("Cleanup failed.")
+            self._rebuild_index()
             raise
 
     def install_remote_sdk(self, version):
+        from pebble_tool.sdk.requirements import Requirements
         sdk_info = self.request("/v1/files/sdk-core/{}?channel={}".format(version, self.get_channel())).json()
         if 'version' not in sdk_info:
             raise SDKInstallError("SDK {} could not be downloaded.".format(version))
@@ -183,15 +255,10 @@ https://developer.getpebble.com/legal/sdk-license
         except (OSError, TypeError):
             pass
         os.symlink(path, self._current_path)
+        self._rebuild_index()
 
     def get_current_sdk(self):
-        if self.current_path is None:
-            return None
-        manifest_path = os.path.join(self.current_path, "manifest.json")
-        if not os.path.exists(manifest_path):
-            return None
-        with open(manifest_path) as f:
-            return json.load(f)['version']
+        return self._get_index()['current_version']
 
     @classmethod
     def set_channel(cls, channel):
@@ -273,27 +340,28 @@ subprocess.call([sys.executable, {}] + sys.argv[1:])
 
     @property
     def current_path(self):
-        path = self._current_path
-        if not os.path.exists(path):
-            return None
-        return os.path.join(path, 'sdk-core')
+        return self._get_index()['current_path']
 
     @property
     def _current_path(self):
         return os.path.join(self.sdk_dir, "current")
 
     def request(self, path, *args):
+        import requests
         return requests.get("{}{}".format(self.DOWNLOAD_SERVER, path), *args)
 
+    def _is_indexed(self, version):
+        return any(name == version for name, manifest in self._get_index()['sdks'])
+
     def root_path_for_sdk(self, version):
         path = os.path.join(self.sdk_dir, version)
-        if not os.path.exists(path):
+        if not self._is_indexed(version) and not os.path.exists(path):
             raise MissingSDK("SDK {} is not installed.".format(version))
         return path
 
     def path_for_sdk(self, version):
         path = os.path.join(self.root_path_for_sdk(version), 'sdk-core')
-        if not os.path.exists(path):
+        if not self._is_indexed(version) and not os.path.exists(path):
             raise MissingSDK("SDK {} is not installed.".format(version))
         return path
 
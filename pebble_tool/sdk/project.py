@@ -12,11 +12,53 @@ from pebble_tool.exceptions import (InvalidProjectException, InvalidJSONExceptio
 from pebble_tool.sdk import sdk_version
 from . import pebble_platforms
 
+_json_cache = {}
+_project_cache = {}
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def _load_json(path):
+    """
+    Parses the JSON file at path, reusing the previous result if the file hasn't changed since. The result is shared,
+    so must not be modified.
+    """
+    signature = _file_signature(path)
+    if signature is None:
+        raise IOError("No such file: {}".format(path))
+    cached = _json_cache.get(path)
+    if cached is None or cached[0] != signature:
+        try:
+            with open(path) as f:
+                cached = (signature, json.load(f), None)
+        except ValueError as e:
+            cached = (signature, None, e)
+        _json_cache[path] = cached
+    if cached[2] is not None:
+        raise cached[2]
+    return cached[1]
+
+
+def _project_key(project_dir):
+    return (_file_signature(os.path.join(project_dir, 'package.json')),
+            _file_signature(os.path.join(project_dir, 'appinfo.json')),
+            sdk_version())
+
 
 class PebbleProject(object):
     def __new__(cls, project_dir=None):
         if project_dir is None:
             project_dir = os.getcwd()
+        # Projects are reused for as long as their project info (and our SDK) stays the same.
+        cached = _project_cache.get(os.path.abspath(project_dir))
+        if cached is not None and cached._key == _project_key(project_dir):
+            return cached
         if NpmProject.should_process(project_dir):
             return NpmProject(project_dir)
         else:
@@ -25,10 +67,16 @@ class PebbleProject(object):
     def __init__(self, project_dir=None):
         if project_dir is None:
             project_dir = os.getcwd()
+        key = _project_key(project_dir)
+        if getattr(self, '_key', None) == key:
+            # We got this from the cache in __new__; it's already set up.
+            return
         self.project_dir = project_dir
         self.check_project_directory(self.project_dir)
         self._parse_project()
         self._sanity_check()
+        self._key = key
+        _project_cache[os.path.abspath(project_dir)] = self
 
     def _sanity_check(self):
         """Check to see if the current directory matches what is created by PblProjectCreator.run.
@@ -84,11 +132,9 @@ class AppinfoProject(PebbleProject):
             raise InvalidProjectException("This is not a project directory.")
 
         try:
-            with open(os.path.join(project_dir, "appinfo.json"), "r") as f:
-                try:
-                    json.load(f)
-                except ValueError as e:
-                    raise InvalidJSONException("Could not parse appinfo.json: %s" % e)
+            _load_json(os.path.join(project_dir, "appinfo.json"))
+        except ValueError as e:
+            raise InvalidJSONException("Could not parse appinfo.json: %s" % e)
         except IOError:
             raise InvalidProjectException("Couldn't open project info.")
 
@@ -97,8 +143,7 @@ class AppinfoProject(PebbleProject):
         return os.path.exists(os.path.join(project_dir, 'appinfo.json'))
 
     def _parse_project(self):
-        with open(os.path.join(self.project_dir, 'appinfo.json')) as f:
-            self.appinfo = json.load(f)
+        self.appinfo = _load_json(os.path.join(self.project_dir, 'appinfo.json'))
 
         self.uuid = uuid.UUID(self.appinfo['uuid'])
         self.short_name = self.appinfo['shortName']
@@ -132,33 +177,25 @@ class NpmProject(PebbleProject):
         """
 
         try:
-            with open(os.path.join(project_dir, "package.json"), "r") as f:
-                try:
-                    app_info = json.load(f)
-                except ValueError as e:
-                    raise InvalidJSONException("Could not parse package.json: %s" % ex)
-                if 'pebble' not in app_info:
-                    raise InvalidProjectException("package.json doesn't have a 'pebble' key.")
+            app_info = _load_json(os.path.join(project_dir, "package.json"))
+        except ValueError as e:
+            raise InvalidJSONException("Could not parse package.json: %s" % e)
         except IOError:
             if not os.path.isdir(os.path.join(project_dir, 'src')):
                 raise InvalidProjectException("This is not a project directory.")
             raise InvalidProjectException("Couldn't open project info.")
+        if 'pebble' not in app_info:
+            raise InvalidProjectException("package.json doesn't have a 'pebble' key.")
 
     @staticmethod
     def should_process(project_dir):
-        package_json_path = os.path.join(project_dir, 'package.json')
-        if os.path.exists(package_json_path):
-            with open(package_json_path) as f:
-                try:
-                    if 'pebble' in json.load(f):
-                        return True
-                except ValueError:
-                    return False
-        return False
+        try:
+            return 'pebble' in _load_json(os.path.join(project_dir, 'package.json'))
+        except (IOError, ValueError):
+            return False
 
     def _parse_project(self):
-        with open(os.path.join(self.project_dir, 'package.json')) as f:
-            self.project_info = json.load(f)
+        self.project_info = _load_json(os.path.join(self.project_dir, 'package.json'))
 
         self.appinfo = self.project_info['pebble']
         self.short_name = self.project_info['name']
@@ -169,7 +206,7 @@ class NpmProject(PebbleProject):
         self.enable_multi_js = self.appinfo.get('enableMultiJS', False)
         self.capabilities = self.appinfo.get('capabilities', [])
         self.project_type = self.appinfo.get('projectType', 'native')
-        self.dependencies = self.project_info.get('dependencies', {})
+        self.dependencies = dict(self.project_info.get('dependencies', {}))
         self.dependencies.update(self.project_info.get('devDependencies', {}))
         self.resources = self.appinfo.get('resources', {})
         self.message_keys = self.appinfo.get('messageKeys', {})
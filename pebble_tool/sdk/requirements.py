@@ -7,6 +7,7 @@ import subprocess
 import sys
 
 from pebble_tool.exceptions import ToolError
+from pebble_tool.util import probe_cache
 from pebble_tool.version import __version__
 
 __author__ = 'katharine'
@@ -54,7 +55,7 @@ class Requirements(object):
         if 'qemu' not in self._version_cache:
             qemu_path = os.environ.get('PEBBLE_QEMU_PATH', 'qemu-pebble')
             try:
-                result = subprocess.check_output([qemu_path, '--version'], stderr=subprocess.STDOUT)
+                result = probe_cache.check_output([qemu_path, '--version'], stderr=subprocess.STDOUT)
             except (subprocess.CalledProcessError, OSError):
                 version = None
             else:
@@ -70,7 +71,7 @@ class Requirements(object):
         if 'pypkjs' not in self._version_cache:
             pypkjs_path = os.environ.get('PHONESIM_PATH', 'phonesim.py')
             try:
-                result = subprocess.check_output([sys.executable, pypkjs_path, '--version'], stderr=subprocess.STDOUT)
+                result = probe_cache.check_output([sys.executable, pypkjs_path, '--version'], stderr=subprocess.STDOUT)
             except subprocess.CalledProcessError:
                 version = '1.0.4'  # The version before we started including version numbers.
             except OSError:
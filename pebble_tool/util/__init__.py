@@ -12,3 +12,14 @@ def get_persist_dir():
     if not os.path.exists(dir):
         os.makedirs(dir)
     return dir
+
+
+def replace_file(source, destination):
+    """Renames `source` to `destination`, replacing it if it exists, which os.rename won't do on Windows."""
+    try:
+        os.rename(source, destination)
+    except OSError:
+        if platform.system() != 'Windows' or not os.path.exists(destination):
+            raise
+        os.remove(destination)
+        os.rename(source, destination)
@@ -11,65 +11,109 @@ import logging
 import os.path
 import platform
 import socket
-import threading
 import uuid
 
-import requests
-
-from pebble_tool.account import get_default_account
 from pebble_tool.sdk.project import PebbleProject
 from pebble_tool.exceptions import MissingSDK, PebbleProjectException
 from pebble_tool.sdk import sdk_path, sdk_version, get_persist_dir
+from pebble_tool.util.detached import spawn_detached
 from pebble_tool.util.wsl import is_secretly_windows
 from pebble_tool.version import __version__
 
 logger = logging.getLogger("pebble_tool.util.analytics")
 
 
-class PebbleAnalytics(threading.Thread):
+class PebbleAnalytics(object):
+    """
+    Collects analytics events. Rather than posting them ourselves (and making the user wait for that to finish before
+    they get their prompt back), :meth:`flush` appends them to the pending journal and hands that off to a detached
+    process.
+    """
     TD_SERVER = "https://td.getpebble.com/td.pebble.sdk_events"
+    # If we've been offline for a long time, only the most recent events are kept.
+    MAX_PENDING_EVENTS = 1000
 
     def __init__(self):
-        self.mark = threading.Event()
-        self.should_run = True
-        self.file_lock = threading.Lock()
-        try:
-            with open(self.pending_filename) as f:
-                old_events = json.load(f)
-        except (IOError, ValueError):
-            old_events = []
-        self.pending = collections.deque(old_events)
-        super(PebbleAnalytics, self).__init__()
-        self.daemon = True
-        self.start()
-
-    @property
-    def pending_filename(self):
+        self.pending = []
+        # The parts of each event that don't change between events.
+        self._identity = None
+        self._host_info = None
+
+    @classmethod
+    def journal_filename(cls):
+        # Events waiting to be posted, one per line. Nothing but _take_events ever does anything but append to it.
+        return os.path.join(get_persist_dir(), "pending_analytics.jsonl")
+
+    @classmethod
+    def _legacy_filename(cls):
+        # Older versions of the tool kept the pending events in a single JSON list.
         return os.path.join(get_persist_dir(), "pending_analytics.json")
 
-    def run(self):
-        should_track = self._should_track()
-        first_run = True
-        while first_run or self.should_run:
-            first_run = False
-            while True:
-                try:
-                    current = self.pending.popleft()
-                except IndexError:
-                    break
-                if should_track:
-                    requests.post(self.TD_SERVER, data=current)
+    def flush(self):
+        if not self.pending:
+            return
+        self._append_events(self.pending)
+        self.pending = []
+        spawn_detached(__name__, 'send_pending_events')
+
+    @classmethod
+    def _append_events(cls, events):
+        data = ''.join(json.dumps(event) + '\n' for event in events)
+        # A single write with O_APPEND, so that lines from concurrent writers can't end up interleaved.
+        fd = os.open(cls.journal_filename(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def _take_events(cls):
+        """Claims every pending event for this process, by moving the journal out of the way, and returns them."""
+        events = []
+        for filename, is_journal in ((cls._legacy_filename(), False), (cls.journal_filename(), True)):
+            spool_filename = "{}.{}".format(filename, os.getpid())
+            try:
+                os.rename(filename, spool_filename)
+            except OSError:
+                continue
+            with open(spool_filename) as f:
+                if is_journal:
+                    for line in f:
+                        try:
+                            events.append(json.loads(line))
+                        except ValueError:
+                            pass
                 else:
-                    logger.debug("Analytics disabled; not posting.")
-                self._store_queue()
-            self.mark.wait()
-            self.mark.clear()
+                    try:
+                        events.extend(json.load(f))
+                    except ValueError:
+                        pass
+            os.unlink(spool_filename)
+        return events[-cls.MAX_PENDING_EVENTS:]
 
-    def wait(self, timeout):
-        self.mark.set()
-        self.should_run = False
-        self.join(timeout)
-        return self.is_alive
+    @classmethod
+    def send_pending(cls):
+        """Posts every pending event. This is run in the detached process."""
+        import requests
+        events = cls._take_events()
+        if not events:
+            return
+        if not cls._has_permission():
+            logger.debug("Analytics disabled; not posting.")
+            return
+        if not cls._should_track():
+            cls._append_events(events)
+            return
+        # The endpoint only accepts one event per request, but we can at least keep the connection open between them.
+        session = requests.Session()
+        for i, event in enumerate(events):
+            try:
+                session.post(cls.TD_SERVER, data=event, timeout=10).raise_for_status()
+            except requests.RequestException as e:
+                logger.debug("Posting analytics failed: %s", e)
+                # Whatever went wrong is likely to affect the rest too; try again next time.
+                cls._append_events(events[i:])
+                break
 
     @classmethod
     def _flatten(cls, d, parent_key=''):
@@ -83,6 +127,10 @@ class PebbleAnalytics(threading.Thread):
         return dict(items)
 
     def submit_event(self, event, force=False, **data):
+        # Events are dropped unposted without permission, so don't bother assembling them (which would mean
+        # loading the account, among other things).
+        if not force and not self._has_permission():
+            return
         analytics = {
             'event': event,
             'identity': self._get_identity(),
@@ -106,27 +154,20 @@ class PebbleAnalytics(threading.Thread):
             'json': json.dumps(td_obj)
         }
         if force:
+            import requests
             requests.post(self.TD_SERVER, data=fields)
             logger.debug("Synchronously transmitting analytics data: {}".format(analytics))
         else:
             logger.debug("Queueing analytics data: {}".format(analytics))
-            self._enqueue(fields)
-
-    def _enqueue(self, fields):
-        self.pending.append(fields)
-        self._store_queue()
-        self.mark.set()
+            self.pending.append(fields)
 
-    def _store_queue(self):
-        with open(self.pending_filename, 'w') as f:
-            json.dump(list(self.pending), f)
-
-    def _should_track(self):
-        # Should we track analytics?
-        permission_file = os.path.join(self.get_option_dir(), "ENABLE_ANALYTICS")
-        if not os.path.exists(permission_file):
-            return False
+    @classmethod
+    def _has_permission(cls):
+        return os.path.exists(os.path.join(cls.get_option_dir(), "ENABLE_ANALYTICS"))
 
+    @classmethod
+    def _should_track(cls):
+        import requests
         # Don't track if internet connection is down
         try:
             # NOTE: This is the IP address of www.google.com. On certain
@@ -140,13 +181,18 @@ class PebbleAnalytics(threading.Thread):
         return True
 
     def _get_identity(self):
-        account = get_default_account()
-        identity = {
-            'sdk_client_id': self._get_machine_identifier()
-        }
-        if account.is_logged_in:
-            identity['user'] = account.id
-        return identity
+        if self._identity is None:
+            from pebble_tool.account import get_default_account
+            account = get_default_account()
+            identity = {
+                'sdk_client_id': self._get_machine_identifier()
+            }
+            # Only if we already know it: fetching it would mean waiting for the auth server.
+            user_id = account.cached_id
+            if user_id is not None:
+                identity['user'] = user_id
+            self._identity = identity
+        return self._identity
 
     def _get_machine_identifier(self):
         # Get installation info. If we detect a new install, post an appropriate event
@@ -174,12 +220,14 @@ class PebbleAnalytics(threading.Thread):
         }
 
     def _get_host_info(self):
-        return {
-            'platform': platform.platform(),
-            'is_vm': self._is_running_in_vm(),
-            'is_wsl': is_secretly_windows(),
-            'python_version': platform.python_version(),
-        }
+        if self._host_info is None:
+            self._host_info = {
+                'platform': platform.platform(),
+                'is_vm': self._is_running_in_vm(),
+                'is_wsl': is_secretly_windows(),
+                'python_version': platform.python_version(),
+            }
+        return self._host_info
 
     @classmethod
     def get_option_dir(cls):
@@ -213,8 +261,12 @@ def post_event(event, **data):
     PebbleAnalytics.get_shared().submit_event(event, **data)
 
 
-def wait_for_analytics(timeout):
-    PebbleAnalytics.get_shared().wait(timeout)
+def flush_analytics():
+    PebbleAnalytics.get_shared().flush()
+
+
+def send_pending_events():
+    PebbleAnalytics.send_pending()
 
 
 def analytics_prompt():
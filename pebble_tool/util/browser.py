@@ -10,6 +10,7 @@ from six.moves.urllib import parse as urlparse
 import webbrowser
 
 from .phone_sensor import SENSOR_PAGE_HTML
+from .waiting import Waiter
 
 
 logger = logging.getLogger("pebble_tool.util.browser")
@@ -25,8 +26,7 @@ class BrowserController(object):
         self.serve_page(port, callback)
 
     def serve_page(self, port, callback):
-        # This is an array so AppConfigHandler doesn't create an instance variable when trying to set the state to False
-        running = [True]
+        waiter = Waiter()
 
         class AppConfigHandler(BaseHTTPServer.BaseHTTPRequestHandler):
             def do_GET(self):
@@ -35,7 +35,7 @@ class BrowserController(object):
                     self.send_response(200)
                     self.end_headers()
                     self.wfile.write("OK")
-                    running[0] = False
+                    waiter.set()
                     callback(query)
                 else:
                     self.send_response(404)
@@ -43,8 +43,12 @@ class BrowserController(object):
                     self.wfile.write("Not Found")
 
         server = BaseHTTPServer.HTTPServer(('', port), AppConfigHandler)
-        while running[0]:
-            server.handle_request()
+        try:
+            while waiter.wait([server]) == Waiter.READABLE:
+                server.handle_request()
+        finally:
+            server.server_close()
+            waiter.close()
 
     def url_append_params(self, url, params):
         parsed = urlparse.urlparse(url, "http")
@@ -118,12 +122,15 @@ class BrowserController(object):
                   "browser.".format(server.server_port))
 
         print("\nUse Ctrl-C to stop sending sensor data to the emulator.\n")
-        try:
-            server.serve_forever()
-        except KeyboardInterrupt:
-            print("Stopping...")
-            server.server_close()
-            time.sleep(2) # Wait for WS connection to die between phone/QEMU
+        with Waiter() as waiter:
+            try:
+                while waiter.wait([server]) == Waiter.READABLE:
+                    server.handle_request()
+            except KeyboardInterrupt:
+                pass
+        print("Stopping...")
+        server.server_close()
+        time.sleep(2) # Wait for WS connection to die between phone/QEMU
 
     def _choose_port(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
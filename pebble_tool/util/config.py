@@ -1,26 +1,89 @@
 from __future__ import absolute_import, print_function
 __author__ = 'katharine'
 
+from contextlib import contextmanager
+import copy
 import json
+import os
 import os.path
+import tempfile
 import threading
 
-from . import get_persist_dir
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from . import get_persist_dir, replace_file
+
+
+def _merge_changes(target, old, new):
+    """Applies whatever changed between old and new to target, descending into dictionaries."""
+    for key in set(old) | set(new):
+        if key not in new:
+            target.pop(key, None)
+        elif key not in old or old[key] != new[key]:
+            if isinstance(new[key], dict) and isinstance(old.get(key, {}), dict) \
+                    and isinstance(target.get(key), dict):
+                _merge_changes(target[key], old.get(key, {}), new[key])
+            else:
+                target[key] = copy.deepcopy(new[key])
 
 
 class Config(object):
     def __init__(self):
         self.path = os.path.join(get_persist_dir(), 'settings.json')
         self.lock = threading.Lock()
+        self.content = self._read()
+        self._saved_content = copy.deepcopy(self.content)
+
+    def _read(self):
         try:
             with open(self.path) as f:
-                self.content = json.load(f)
-        except IOError:
-            self.content = {}
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    @contextmanager
+    def _file_lock(self):
+        # Other pebble processes may be saving at the same time as us.
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _file_mode(self):
+        try:
+            return os.stat(self.path).st_mode & 0o777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
 
     def save(self):
-        with open(self.path, 'w') as f:
-            json.dump(self.content, f, indent=4)
+        """
+        Writes out any settings changed since we loaded them. Changes made by other processes in the meantime are kept,
+        unless we changed the same setting.
+        """
+        with self.lock:
+            if self.content == self._saved_content:
+                return
+            with self._file_lock():
+                content = self._read()
+                _merge_changes(content, self._saved_content, self.content)
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.settings')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(content, f, indent=4)
+                # mkstemp makes files only we can read; keep the mode settings.json would have had anyway.
+                os.chmod(temp_path, self._file_mode())
+                replace_file(temp_path, self.path)
+            self.content = content
+            self._saved_content = copy.deepcopy(content)
 
     def get(self, key, default=None):
         return self.content.get(key, default)
@@ -0,0 +1,88 @@
+"""
+The client half of `pebble daemon`. If a daemon is running, `pebble` sends it the command line and relays whatever it
+prints, instead of connecting to the watch itself. The protocol is one JSON object per line: the client sends a single
+request, and the daemon replies with any number of {"stdout": ...} and {"stderr": ...} messages followed by either
+{"exit": status} or, if the command has to be run by the client after all, {"local": true}.
+"""
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import socket
+import sys
+
+import six
+
+from pebble_tool.util import get_persist_dir, profiling, stats
+
+
+def daemon_socket_path():
+    return os.path.join(get_persist_dir(), 'daemon.sock')
+
+
+def connect_to_daemon():
+    """Returns a socket connected to the running daemon, or None if there isn't one."""
+    path = daemon_socket_path()
+    if not os.path.exists(path):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except socket.error:
+        s.close()
+        return None
+    return s
+
+
+def send_message(stream, message):
+    stream.write((json.dumps(message) + '\n').encode('utf-8'))
+    stream.flush()
+
+
+def forward_to_daemon(args):
+    """
+    Runs the given `pebble` command in the running daemon, if there is one. Returns the exit status, or None if the
+    command should be run locally.
+    """
+    # When profiling, the command has to run here to be measured.
+    if os.environ.get('PEBBLE_NO_DAEMON') or args[:1] == ['daemon'] or '-' in args or profiling.is_enabled() \
+            or stats.is_enabled():
+        return None
+    s = connect_to_daemon()
+    if s is None:
+        return None
+    try:
+        stream = s.makefile('rwb')
+        send_message(stream, {
+            'args': args,
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+        })
+        interrupted = False
+        while True:
+            try:
+                line = stream.readline()
+            except KeyboardInterrupt:
+                if interrupted:
+                    raise
+                # Let the daemon interrupt the command, then carry on reading whatever it has left to say.
+                interrupted = True
+                s.shutdown(socket.SHUT_WR)
+                continue
+            if not line:
+                print("Lost connection to the pebble daemon.", file=sys.stderr)
+                return 1
+            message = json.loads(line.decode('utf-8'))
+            for name in ('stdout', 'stderr'):
+                if name in message:
+                    text = message[name]
+                    if six.PY2:
+                        text = text.encode('utf-8')
+                    getattr(sys, name).write(text)
+                    getattr(sys, name).flush()
+            if 'exit' in message:
+                return message['exit']
+            if message.get('local'):
+                return None
+    finally:
+        s.close()
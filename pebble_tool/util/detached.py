@@ -0,0 +1,29 @@
+"""
+Runs work that shouldn't hold up the command the user is waiting for (like posting analytics) in a separate, detached
+process that can outlive us.
+"""
+from __future__ import absolute_import, print_function
+
+import importlib
+import os
+import subprocess
+import sys
+
+
+def spawn_detached(module, function, *args):
+    """Calls `function` from `module` with the given string arguments, in a new background process."""
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    # Timing is for the command that was run, not the jobs it started.
+    env = {k: v for k, v in os.environ.items() if k not in ('PEBBLE_TRACE', 'PEBBLE_PROFILE_STARTUP')}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen([sys.executable, '-m', __name__, module, function] + list(args),
+                         stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True, env=env,
+                         # A new session, so the job isn't killed along with us if the user hits ctrl-C.
+                         preexec_fn=getattr(os, 'setsid', None))
+
+
+if __name__ == '__main__':
+    import pebble_tool
+    pebble_tool.cleanup_at_exit = False
+    getattr(importlib.import_module(sys.argv[1]), sys.argv[2])(*sys.argv[3:])
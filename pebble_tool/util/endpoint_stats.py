@@ -0,0 +1,164 @@
+"""
+Cheap, always-on instrumentation for the connections commands open: packet and byte counts for each endpoint in each
+direction, and histograms of how long requests take to be answered. Unlike the packet logging that -vvv turns on, this
+is fast enough to leave running while measuring throughput. It's logged at exit when running with -v, and is
+available as `stats` in `pebble repl`.
+"""
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+import logging
+import math
+import struct
+import threading
+import time
+import weakref
+
+logger = logging.getLogger("pebble_tool.util.endpoint_stats")
+
+# Upper bounds (in milliseconds) of the latency histogram buckets; anything slower goes in a final, open bucket.
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Stats are dropped along with their connections, so a long-running `pebble daemon` doesn't accumulate them.
+_all_stats = weakref.WeakKeyDictionary()  # connection -> ConnectionStats
+
+
+def percentile(sorted_values, percent):
+    """The nearest-rank `percent`th percentile of `sorted_values`, which must be sorted and not empty."""
+    # The smallest value that at least `percent`% of the values are less than or equal to. (Multiplying first keeps
+    # exact ranks exact: 0.07 * 100 is slightly more than 7.)
+    index = max(0, int(math.ceil(percent * len(sorted_values) / 100.0)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarise_latencies(seconds):
+    """
+    Summarises a list of round trip times, given in seconds, as their min, average, p50, p95, p99 and max in
+    milliseconds. Returns None if there aren't any.
+    """
+    if not seconds:
+        return None
+    ms = sorted(x * 1000 for x in seconds)
+    return OrderedDict([
+        ('min', ms[0]),
+        ('avg', sum(ms) / len(ms)),
+        ('p50', percentile(ms, 50)),
+        ('p95', percentile(ms, 95)),
+        ('p99', percentile(ms, 99)),
+        ('max', ms[-1]),
+    ])
+
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if ms <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def describe(self):
+        buckets = []
+        lower = 0
+        for bound, count in zip(LATENCY_BUCKETS + (None,), self.counts):
+            if count:
+                buckets.append("{}-{}ms: {}".format(lower, bound, count) if bound else ">{}ms: {}".format(lower, count))
+            lower = bound
+        return "n={} min={:.1f}ms mean={:.1f}ms max={:.1f}ms [{}]".format(self.count, self.min, self.mean, self.max,
+                                                                         ', '.join(buckets))
+
+
+class ConnectionStats(object):
+    """Counts a connection's traffic by endpoint, and times its requests."""
+    def __init__(self, name):
+        self.name = name
+        self.created = time.time()
+        self.lock = threading.Lock()
+        self.packets = {}  # (direction, endpoint number) -> [packets, bytes]
+        self.latencies = {}  # request name -> LatencyHistogram
+
+    def count(self, direction, message):
+        if len(message) < 4:
+            return
+        endpoint, = struct.unpack_from('!H', message, 2)
+        with self.lock:
+            counts = self.packets.setdefault((direction, endpoint), [0, 0])
+            counts[0] += 1
+            counts[1] += len(message)
+
+    def add_latency(self, name, seconds):
+        with self.lock:
+            self.latencies.setdefault(name, LatencyHistogram()).add(seconds)
+
+    def describe(self):
+        from libpebble2.protocol.base import _PacketRegistry
+        lines = ["Connection statistics for {}:".format(self.name)]
+        with self.lock:
+            for (direction, endpoint), (packets, total_bytes) in sorted(self.packets.items(),
+                                                                        key=lambda x: (x[0][1], x[0][0])):
+                name = _PacketRegistry[endpoint].__name__ if endpoint in _PacketRegistry else "endpoint {}".format(
+                    endpoint)
+                lines.append("  {:<3} {:<24} {:>7} packets {:>10} bytes".format(direction, name, packets, total_bytes))
+            for name, histogram in sorted(self.latencies.items()):
+                lines.append("  latency of {}: {}".format(name, histogram.describe()))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.describe()
+
+
+def instrument(connection, name):
+    """Starts collecting stats for `connection`, and returns them."""
+    stats = ConnectionStats(name)
+    connection.register_raw_inbound_handler(lambda message: stats.count('in', message))
+    connection.register_raw_outbound_handler(lambda message: stats.count('out', message))
+
+    send_and_read = connection.send_and_read
+    read_transport_message = connection.read_transport_message
+
+    def timed_send_and_read(packet, endpoint, *args, **kwargs):
+        start = time.time()
+        result = send_and_read(packet, endpoint, *args, **kwargs)
+        stats.add_latency("{} -> {}".format(type(packet).__name__, endpoint.__name__), time.time() - start)
+        return result
+
+    def timed_read_transport_message(origin, message_type, *args, **kwargs):
+        start = time.time()
+        result = read_transport_message(origin, message_type, *args, **kwargs)
+        stats.add_latency("{} from {}".format(message_type.__name__, origin.__name__), time.time() - start)
+        return result
+
+    connection.send_and_read = timed_send_and_read
+    connection.read_transport_message = timed_read_transport_message
+    _all_stats[connection] = stats
+    return stats
+
+
+def stats_for(connection):
+    """The stats being collected for `connection`, or None if it isn't instrumented."""
+    return _all_stats.get(connection)
+
+
+def log_all():
+    """Logs the stats for every connection that's still open (at INFO level, so they're only shown with -v)."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    for stats in sorted(list(_all_stats.values()), key=lambda x: x.created):
+        logger.info(stats.describe())
@@ -0,0 +1,224 @@
+"""
+A small futures layer for waiting on several operations at once.
+
+:class:`MatchedRequests` sends requests straight away and has the connection's own reader thread deliver their
+responses, so any number of them can be outstanding without a thread each. Work that libpebble2 only offers as a
+blocking call (opening a connection, installing an app) can be pushed onto a short-lived thread with
+:func:`run_in_thread`, and waited on in the same way with :func:`wait`.
+"""
+from __future__ import absolute_import, print_function
+
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+import six
+
+from . import endpoint_stats
+from .waiting import Waiter, on_disconnect, remove_disconnect_callback
+
+
+class CancelledError(Exception):
+    pass
+
+
+class Future(object):
+    """The result of an operation that may not have finished yet."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def cancelled(self):
+        return self._done and self._exc_info is not None and isinstance(self._exc_info[1], CancelledError)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exception, traceback=None):
+        self._finish(None, (type(exception), exception, traceback))
+
+    def cancel(self):
+        """Gives up on the operation. Returns False if it had already finished."""
+        return self._finish(None, (CancelledError, CancelledError(), None))
+
+    def _finish(self, result, exc_info):
+        with self._lock:
+            if self._done:
+                return False
+            self._done = True
+            self._result = result
+            self._exc_info = exc_info
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+        return True
+
+    def add_done_callback(self, callback):
+        """Calls `callback` with this future once it's finished (which may be right away, on this thread)."""
+        with self._lock:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self, timeout=None):
+        """
+        Waits for the operation to finish and returns its result, or raises its exception. If `timeout` seconds pass
+        first, the operation is cancelled and :exc:`libpebble2.exceptions.TimeoutError` is raised.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+    def exception(self, timeout=None):
+        """Waits for the operation to finish, and returns the exception it raised, if any."""
+        self._wait(timeout)
+        return self._exc_info[1] if self._exc_info is not None else None
+
+    def _wait(self, timeout):
+        if not wait([self], timeout):
+            from libpebble2.exceptions import TimeoutError
+            self.cancel()
+            raise TimeoutError()
+
+
+def wait(futures, timeout=None, return_when_first=False):
+    """
+    Blocks until every one of `futures` has finished (or just one of them, if `return_when_first` is set). Returns
+    False if `timeout` seconds passed first.
+    """
+    futures = list(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    with Waiter() as waiter:
+        def finished(future):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0 or return_when_first:
+                    waiter.set()
+
+        for future in futures:
+            future.add_done_callback(finished)
+        if not futures:
+            return True
+        reason = waiter.wait(timeout=timeout)
+    if reason == Waiter.SIGNALLED:
+        raise KeyboardInterrupt
+    return reason == Waiter.COMPLETED
+
+
+def run_in_thread(function, *args, **kwargs):
+    """Calls `function` on a new thread, and returns a :class:`Future` for its result."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e, sys.exc_info()[2])
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.parent_ident = threading.current_thread().ident
+    thread.start()
+    return future
+
+
+class MatchedRequests(object):
+    """
+    Sends requests to one endpoint whose responses say which request they answer (by a cookie or transaction ID), and
+    pairs them up by that rather than by order. A response that never comes, or comes after its request was given up
+    on, then doesn't get mistaken for the answer to the next request.
+
+    Each future's result is a `(response, seconds)` tuple, where `seconds` is the round trip time. Responses to
+    requests that were given up on are counted in :attr:`late`; those that match no request we sent, in
+    :attr:`unmatched`.
+    """
+    MAX_GIVEN_UP = 1024
+
+    def __init__(self, connection, endpoint, identify, on_unmatched=None):
+        """
+        `identify` is called with each response from `endpoint`, and returns the identifier of its request. If given,
+        `on_unmatched` is called (on the connection's reader thread) with each response that matches no request.
+        """
+        self.connection = connection
+        self.endpoint = endpoint
+        self.identify = identify
+        self.on_unmatched = on_unmatched
+        self.late = 0
+        self.unmatched = 0
+        self._stats = endpoint_stats.stats_for(connection)
+        self._lock = threading.Lock()
+        self._pending = {}  # identifier -> (future, time sent, request name)
+        self._given_up = OrderedDict()  # identifiers of requests we stopped waiting for, oldest first
+        self._handle = connection.register_endpoint(endpoint, self._received)
+        on_disconnect(connection, self._disconnected)
+
+    def request(self, packet, identifier):
+        """Sends `packet`, which `identifier` identifies, and returns a future for its response."""
+        future = Future()
+        name = "{} -> {}".format(type(packet).__name__, self.endpoint.__name__)
+        with self._lock:
+            self._given_up.pop(identifier, None)
+            self._pending[identifier] = (future, time.time(), name)
+        future.add_done_callback(lambda f: self._finished(identifier, f))
+        try:
+            self.connection.send_packet(packet)
+        except Exception as e:
+            future.set_exception(e, sys.exc_info()[2])
+        if not self.connection.connected:
+            self._disconnected()
+        return future
+
+    def close(self):
+        """Stops listening for responses, and cancels the futures for any still to come."""
+        remove_disconnect_callback(self.connection, self._disconnected)
+        self.connection.unregister_endpoint(self._handle)
+        for future in self._take_all():
+            future.cancel()
+
+    def _received(self, message):
+        now = time.time()
+        identifier = self.identify(message)
+        with self._lock:
+            request = self._pending.pop(identifier, None)
+            if request is None:
+                if self._given_up.pop(identifier, None) is not None:
+                    self.late += 1
+                    return
+                self.unmatched += 1
+        if request is None:
+            if self.on_unmatched is not None:
+                self.on_unmatched(message)
+            return
+        future, sent, name = request
+        if self._stats is not None:
+            self._stats.add_latency(name, now - sent)
+        future.set_result((message, now - sent))
+
+    def _finished(self, identifier, future):
+        with self._lock:
+            if self._pending.get(identifier, (None,))[0] is future:
+                # It was cancelled (probably by timing out), so its response will be late, if it ever comes.
+                del self._pending[identifier]
+                self._given_up[identifier] = True
+                # Don't remember them forever on a connection that's stopped answering.
+                while len(self._given_up) > self.MAX_GIVEN_UP:
+                    self._given_up.popitem(last=False)
+
+    def _take_all(self):
+        with self._lock:
+            return [future for future, sent, name in self._pending.values()]
+
+    def _disconnected(self):
+        from libpebble2.exceptions import ConnectionError
+        for future in self._take_all():
+            future.set_exception(ConnectionError("Disconnected."))
@@ -0,0 +1,32 @@
+"""
+Finds the options given to `pebble` itself (--trace, --stats, etc.) without building the argument parser, for the
+options that have to take effect before it's built. Only the standard library may be imported here, so that it can be
+used before import timing starts.
+"""
+from __future__ import absolute_import, print_function
+
+# Options to `pebble` itself that take a value.
+OPTIONS_WITH_VALUES = {'--stats-json', '--trace'}
+
+
+def split(args):
+    """
+    Returns ({option: value}, command) for the arguments to `pebble`: the options given before the command (with True
+    as the value of those that don't take one), and the name of the command, or None.
+    """
+    options = {}
+    pending = None
+    for arg in args:
+        if pending is not None:
+            options[pending] = arg
+            pending = None
+        elif arg.startswith('--') and '=' in arg:
+            name, value = arg.split('=', 1)
+            options[name] = value
+        elif arg in OPTIONS_WITH_VALUES:
+            pending = arg
+        elif arg.startswith('-'):
+            options[arg] = True
+        else:
+            return options, arg
+    return options, None
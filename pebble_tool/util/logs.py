@@ -7,7 +7,6 @@ import os
 import os.path
 import re
 import subprocess
-import time
 import uuid
 import sourcemap
 import sys
@@ -20,6 +19,7 @@ from libpebble2.communication.transports.websocket.protocol import WebSocketPhon
 from pebble_tool.exceptions import PebbleProjectException
 from pebble_tool.sdk import add_tools_to_path
 from pebble_tool.sdk.project import PebbleProject
+from pebble_tool.util.waiting import Waiter
 from colorama import Fore, Back, Style
 from sourcemap.exceptions import SourceMapDecodeError
 
@@ -111,14 +111,17 @@ class PebbleLogPrinter(object):
         return colour
 
     def wait(self):
-        try:
-            while self.pebble.connected:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.stop()
-            return
-        else:
+        with Waiter() as waiter:
+            waiter.watch_connection(self.pebble)
+            try:
+                reason = waiter.wait()
+            except KeyboardInterrupt:
+                self.stop()
+                return
+        if reason == Waiter.DISCONNECTED:
             print("Disconnected.")
+        else:
+            self.stop()
 
     def stop(self):
         for handle in self.handles:
@@ -5,12 +5,13 @@ import os
 import subprocess
 
 from pebble_tool.exceptions import ToolError
+from pebble_tool.util import probe_cache, profiling
 from pebble_tool.util.versions import version_to_key
 
 
 def check_npm():
     try:
-        npm_version = subprocess.check_output(["npm", "--version"]).strip()
+        npm_version = probe_cache.check_output(["npm", "--version"]).strip()
         if version_to_key(npm_version)[0] < 3:
             raise ToolError("We require npm3; you are using version {}.".format(npm_version))
     except OSError:
@@ -21,7 +22,8 @@ def check_npm():
 
 def invoke_npm(args, cwd=None):
     check_npm()
-    subprocess.check_call(["npm"] + args, cwd=cwd)
+    with profiling.phase("npm {}".format(' '.join(args)), 'subprocess'):
+        subprocess.check_call(["npm"] + args, cwd=cwd)
 
 
 def sanity_check():
@@ -0,0 +1,142 @@
+"""
+A cached description of the command tree, which lets us answer `pebble --help`, `pebble <command> --help`,
+`pebble --version` and shell completion requests without building the full argparse tree (and so without importing
+every command module).
+
+To enable completion in bash:
+
+    _pebble() { COMPREPLY=( $(pebble --complete "${COMP_WORDS[@]:1:$COMP_CWORD}") ); }
+    complete -o default -F _pebble pebble
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from pebble_tool.util import get_persist_dir
+from pebble_tool.version import __version__
+
+logger = logging.getLogger("pebble_tool.util.parser_cache")
+
+
+def _cache_path():
+    return os.path.join(get_persist_dir(), 'parser_cache.json')
+
+
+def _command_fingerprint():
+    """
+    Identifies the set of commands and the code that defines their arguments, so that changing either (without
+    bumping the version, as when running from a checkout) invalidates the cache.
+    """
+    from pebble_tool.commands.base import _LazyCommands
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = [os.path.join(package_dir, '__init__.py'), os.path.join(package_dir, 'util', 'global_options.py')]
+    for directory, dirnames, filenames in os.walk(os.path.join(package_dir, 'commands')):
+        dirnames.sort()
+        paths.extend(os.path.join(directory, name) for name in sorted(filenames) if name.endswith('.py'))
+    files = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        files.append([os.path.relpath(path, package_dir), info.st_mtime, info.st_size])
+    description = json.dumps([list(_LazyCommands.items()), files])
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def _cache_key(sdk_version):
+    # argparse wraps help text to $COLUMNS, so that's part of the key too.
+    return [__version__, sdk_version, os.environ.get('COLUMNS'), _command_fingerprint()]
+
+
+def load_tree(sdk_version):
+    try:
+        with open(_cache_path()) as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if cached.get('key') != _cache_key(sdk_version):
+        return None
+    return cached['tree']
+
+
+def save_tree(sdk_version, tree):
+    path = _cache_path()
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.parser_cache')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'key': _cache_key(sdk_version), 'tree': tree}, f)
+        os.rename(temp_path, path)
+    except (IOError, OSError) as e:
+        logger.debug("Couldn't save parser cache: %s", e)
+
+
+def describe_parser(parser, version_string=None):
+    node = {
+        'help': parser.format_help(),
+        'options': [],
+        'option_choices': {},
+        'choices': [],
+        'commands': {},
+    }
+    if version_string is not None:
+        node['version'] = version_string
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            for name, subparser in action.choices.items():
+                node['commands'][name] = describe_parser(subparser)
+        elif action.option_strings:
+            node['options'].extend(action.option_strings)
+            if action.choices is not None:
+                for option in action.option_strings:
+                    node['option_choices'][option] = [str(x) for x in action.choices]
+        elif action.choices is not None:
+            node['choices'].extend(str(x) for x in action.choices)
+    return node
+
+
+def _find_node(tree, path):
+    node = tree
+    for word in path:
+        node = node['commands'].get(word)
+        if node is None:
+            return None
+    return node
+
+
+def cached_response(tree, args):
+    """
+    Returns the (stream, text) `pebble` would output for the given arguments, if it's a help or version request we can
+    answer from the tree; otherwise None.
+    """
+    if args == ['--version']:
+        # Python 2's argparse prints the version to stderr.
+        return 'stderr', tree['version'] + '\n'
+    if len(args) > 0 and args[-1] in ('-h', '--help'):
+        node = _find_node(tree, args[:-1])
+        if node is not None:
+            return 'stdout', node['help']
+    return None
+
+
+def complete(tree, words):
+    """Returns possible completions of the last of `words`, the arguments to `pebble` up to the cursor."""
+    if not words:
+        words = ['']
+    node = tree
+    for word in words[:-1]:
+        node = node['commands'].get(word, node)
+    partial = words[-1]
+    previous = words[-2] if len(words) > 1 else None
+    if previous in node['option_choices']:
+        candidates = node['option_choices'][previous]
+    elif partial.startswith('-'):
+        candidates = node['options']
+    else:
+        candidates = sorted(node['commands']) + node['choices']
+    return [x for x in candidates if x.startswith(partial)]
@@ -0,0 +1,89 @@
+"""
+A local history of how long things take (builds, installs, emulator boots, screenshots, connecting), kept in a SQLite
+database in the persist dir so that `pebble perf report` can show how they change over time and across SDK versions.
+Nothing here leaves the machine.
+"""
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+import threading
+import time
+
+from pebble_tool.sdk import sdk_version
+from pebble_tool.util import get_persist_dir
+from pebble_tool.version import __version__
+
+logger = logging.getLogger("pebble_tool.util.perf_history")
+
+# Measurements older than this are dropped.
+MAX_AGE = 365 * 86400
+
+_lock = threading.Lock()
+_pending = []
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    kind TEXT NOT NULL,
+    duration REAL NOT NULL,
+    succeeded INTEGER NOT NULL,
+    project TEXT,
+    platform TEXT,
+    transport TEXT,
+    sdk_version TEXT,
+    tool_version TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_by_kind ON measurements (kind, project, platform, sdk_version, timestamp);
+CREATE INDEX IF NOT EXISTS measurements_by_time ON measurements (timestamp);
+"""
+
+
+def database_path():
+    return os.path.join(get_persist_dir(), 'perf_history.sqlite')
+
+
+def _current_project():
+    # The same guess ToolAppInstaller makes about the name of the project we're in.
+    cwd = os.getcwd()
+    if os.path.exists(os.path.join(cwd, 'package.json')) or os.path.exists(os.path.join(cwd, 'appinfo.json')):
+        return os.path.basename(cwd)
+    return None
+
+
+def record(kind, duration, succeeded=True, platform=None, transport=None, sdk=None):
+    """Notes that a `kind` operation took `duration` seconds. It's written out by :func:`flush`."""
+    with _lock:
+        _pending.append((time.time(), kind, duration, 1 if succeeded else 0, _current_project(), platform, transport,
+                         sdk or sdk_version(), __version__))
+
+
+def connect():
+    import sqlite3
+    db = sqlite3.connect(database_path(), timeout=5)
+    # Losing the last few measurements in a crash doesn't matter, but waiting for the disk on every run would.
+    db.execute("PRAGMA synchronous = OFF")
+    db.executescript(_SCHEMA)
+    return db
+
+
+def flush():
+    """Writes out any measurements recorded so far."""
+    with _lock:
+        if not _pending:
+            return
+        rows = list(_pending)
+        del _pending[:]
+    import sqlite3
+    try:
+        db = connect()
+        try:
+            with db:
+                db.executemany("INSERT INTO measurements (timestamp, kind, duration, succeeded, project, platform, "
+                               "transport, sdk_version, tool_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                db.execute("DELETE FROM measurements WHERE timestamp < ?", (time.time() - MAX_AGE,))
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        logger.debug("Couldn't save performance history: %s", e)
@@ -0,0 +1,107 @@
+"""
+Remembers the output of the commands we run to find out about the user's toolchain (`python -c ...`, `npm --version`,
+`qemu-pebble --version`, ...), so we don't have to spawn them again until something they depend on changes. A result is
+keyed by the command line, by PATH, and by the path, mtime and size of the program and of any files named on the
+command line. Failures aren't remembered, in case they were only temporary.
+
+Version manager shims (pyenv, rbenv, nodenv, asdf) pick the program they really run from the environment and from
+files like `.python-version` in the current directory or above, so nothing here says when their result would change.
+Programs run through one are never cached.
+"""
+from __future__ import absolute_import, print_function
+
+import json
+import logging
+import os
+import subprocess
+import tempfile
+
+import six
+
+from pebble_tool.util import get_persist_dir, profiling
+
+logger = logging.getLogger("pebble_tool.util.probe_cache")
+
+# Version managers put their shims in a directory with this name.
+SHIM_DIRECTORY = 'shims'
+
+_cache = None
+
+
+def _cache_path():
+    return os.path.join(get_persist_dir(), 'probe_cache.json')
+
+
+def _load():
+    global _cache
+    if _cache is None:
+        try:
+            with open(_cache_path()) as f:
+                _cache = json.load(f)
+        except (IOError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save():
+    path = _cache_path()
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.probe_cache')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_cache, f)
+        os.rename(temp_path, path)
+    except (IOError, OSError) as e:
+        logger.debug("Couldn't save probe cache: %s", e)
+
+
+def _find_program(name):
+    if os.path.dirname(name):
+        return os.path.abspath(name) if os.access(name, os.X_OK) else None
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def _file_key(path):
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return [path, stat.st_mtime, stat.st_size]
+
+
+def check_output(args, stderr=None):
+    """
+    Behaves like :func:`subprocess.check_output`, but only actually runs `args` if we haven't already seen the result
+    for the same programs and files.
+    """
+    program = _find_program(args[0])
+    if program is None:
+        raise OSError(2, "No such file or directory: {}".format(args[0]))
+    if os.path.basename(os.path.dirname(program)) == SHIM_DIRECTORY:
+        return _run(args, stderr)
+    files = [_file_key(program)] + [_file_key(arg) for arg in args[1:] if os.path.isfile(arg)]
+    path = os.environ.get('PATH')
+    # Only the latest result for each command line is kept, so the cache can't grow without bound.
+    key = json.dumps([args, stderr == subprocess.STDOUT])
+
+    cache = _load()
+    if key not in cache or cache[key]['files'] != files or cache[key].get('path') != path:
+        try:
+            output = _run(args, stderr)
+        except subprocess.CalledProcessError:
+            if cache.pop(key, None) is not None:
+                _save()
+            raise
+        cache[key] = {'files': files, 'path': path, 'output': output.decode('utf-8', 'replace')}
+        _save()
+
+    output = cache[key]['output']
+    if six.PY2:
+        output = output.encode('utf-8')
+    return output
+
+
+def _run(args, stderr):
+    with profiling.phase("probe {}".format(os.path.basename(args[0])), 'subprocess'):
+        return subprocess.check_output(args, stderr=stderr)
@@ -0,0 +1,143 @@
+from __future__ import absolute_import, division, print_function
+
+from contextlib import contextmanager
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from six.moves import builtins
+
+_enabled = False
+_report_enabled = False
+_trace_path = None
+_original_import = builtins.__import__
+_import_state = threading.local()
+_imports = []  # (module name, depth, self seconds, cumulative seconds, start time, thread), in the order imports finished.
+_phases = []  # (phase name, category, start time, end time, thread, args)
+_thread_names = {}
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    """Starts recording module imports and run phases, to be reported by :func:`report`."""
+    global _report_enabled
+    _report_enabled = True
+    _start()
+
+
+def enable_trace(path):
+    """Starts recording module imports and run phases, to be written to `path` by :func:`write_trace`."""
+    global _trace_path
+    _trace_path = path
+    _start()
+
+
+def _start():
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    builtins.__import__ = _timed_import
+
+
+def _current_thread():
+    thread = threading.current_thread()
+    _thread_names.setdefault(thread.ident, thread.name)
+    return thread.ident
+
+
+def _timed_import(name, globals=None, *args, **kwargs):
+    if name in sys.modules:
+        return _original_import(name, globals, *args, **kwargs)
+    if not hasattr(_import_state, 'stack'):
+        _import_state.stack = []
+    import_stack = _import_state.stack
+    import_stack.append(0)
+    module_count = len(sys.modules)
+    start = time.time()
+    try:
+        return _original_import(name, globals, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        nested = import_stack.pop()
+        if import_stack:
+            import_stack[-1] += elapsed
+        if len(sys.modules) != module_count:
+            _imports.append((_module_name(name, globals), len(import_stack), elapsed - nested, elapsed, start,
+                             _current_thread()))
+
+
+def _module_name(name, globals):
+    # Relative imports (implicit ones, in Python 2) give us a name relative to the importing package.
+    if name not in sys.modules and globals:
+        package = globals.get('__package__') or globals.get('__name__', '').rpartition('.')[0]
+        if not name:
+            return package
+        if package and '{}.{}'.format(package, name) in sys.modules:
+            return '{}.{}'.format(package, name)
+    return name
+
+
+@contextmanager
+def phase(name, category='phase', **args):
+    """Records how long the enclosed block takes. Any keyword arguments are included in the trace."""
+    if not _enabled:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        _phases.append((name, category, start, time.time(), _current_thread(), args))
+
+
+def timed(name, category='phase'):
+    """Decorator that records every call to the function as a phase."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def report(stream=sys.stderr):
+    if not _report_enabled:
+        return
+    print("Import times (ms):", file=stream)
+    print("{:>10} | {:>10} | module".format("self", "cumulative"), file=stream)
+    for name, depth, self_time, cumulative, start, thread in _imports:
+        print("{:10.2f} | {:10.2f} | {}{}".format(self_time * 1000, cumulative * 1000, '  ' * depth, name),
+              file=stream)
+    print("Total import time: {:.2f}ms".format(sum(x[3] for x in _imports if x[1] == 0) * 1000), file=stream)
+    print(file=stream)
+    print("Phases (ms):", file=stream)
+    for name, category, start, end, thread, args in _phases:
+        print("{:10.2f}   {}".format((end - start) * 1000, name), file=stream)
+
+
+def write_trace():
+    """Writes what we recorded as a Chrome trace (for chrome://tracing or https://ui.perfetto.dev)."""
+    if _trace_path is None:
+        return
+    pid = os.getpid()
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+              for thread, name in _thread_names.items()]
+    for name, depth, self_time, cumulative, start, thread in _imports:
+        events.append({'name': name, 'cat': 'import', 'ph': 'X', 'pid': pid, 'tid': thread,
+                       'ts': start * 1e6, 'dur': cumulative * 1e6})
+    for name, category, start, end, thread, args in _phases:
+        events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': thread,
+                       'ts': start * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+    try:
+        with open(_trace_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    except IOError as e:
+        print("Couldn't write trace to {}: {}".format(_trace_path, e), file=sys.stderr)
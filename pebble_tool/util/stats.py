@@ -0,0 +1,115 @@
+"""
+Resource usage for `pebble --stats`: wall time, CPU time (our own and that of the processes we ran), peak memory, and
+how much we sent to and received from the watch.
+"""
+from __future__ import absolute_import, division, print_function
+
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_start_time = time.time()
+_enabled = False
+_json_path = None
+_lock = threading.Lock()
+_transport_bytes = {'sent': 0, 'received': 0}
+_command = None
+
+
+def enable(json_path=None):
+    """Starts counting transport traffic. At exit, :func:`report` prints a summary, or writes it to `json_path`."""
+    global _enabled, _json_path
+    _enabled = True
+    _json_path = json_path
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_command(name):
+    global _command
+    _command = name
+
+
+def count_transport(transport):
+    """Counts the bytes passing through a libpebble2 transport."""
+    if not _enabled:
+        return
+    send_packet, read_packet = transport.send_packet, transport.read_packet
+
+    def counted_send_packet(message, *args, **kwargs):
+        _count('sent', message)
+        return send_packet(message, *args, **kwargs)
+
+    def counted_read_packet():
+        origin, message = read_packet()
+        _count('received', message)
+        return origin, message
+
+    transport.send_packet = counted_send_packet
+    transport.read_packet = counted_read_packet
+
+
+def _count(direction, message):
+    if not isinstance(message, bytes):
+        # Messages for the phone or QEMU themselves are sent as packet objects.
+        message = message.serialise()
+    with _lock:
+        _transport_bytes[direction] += len(message)
+
+
+def collect():
+    stats = {
+        'command': _command,
+        'wall_time': time.time() - _start_time,
+        'transport_bytes_sent': _transport_bytes['sent'],
+        'transport_bytes_received': _transport_bytes['received'],
+    }
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        stats.update({
+            'user_cpu': usage.ru_utime,
+            'sys_cpu': usage.ru_stime,
+            # Linux reports this in kilobytes, macOS in bytes.
+            'peak_rss': usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+            # Only covers processes that have exited and been waited for, so not emulators left running.
+            'children_user_cpu': children.ru_utime,
+            'children_sys_cpu': children.ru_stime,
+        })
+    return stats
+
+
+def report(stream=sys.stderr):
+    if not _enabled:
+        return
+    stats = collect()
+    if _json_path is not None:
+        try:
+            with open(_json_path, 'w') as f:
+                json.dump(stats, f, indent=4, sort_keys=True)
+        except IOError as e:
+            print("Couldn't write stats to {}: {}".format(_json_path, e), file=stream)
+        return
+    lines = [("wall time", "{:.1f} ms".format(stats['wall_time'] * 1000))]
+    if 'user_cpu' in stats:
+        lines += [
+            ("cpu (user/sys)", "{:.1f} / {:.1f} ms".format(stats['user_cpu'] * 1000, stats['sys_cpu'] * 1000)),
+            ("child cpu (user/sys)", "{:.1f} / {:.1f} ms".format(stats['children_user_cpu'] * 1000,
+                                                                  stats['children_sys_cpu'] * 1000)),
+            ("peak rss", "{:.1f} MiB".format(stats['peak_rss'] / 1048576)),
+        ]
+    lines += [
+        ("transport sent", "{} bytes".format(stats['transport_bytes_sent'])),
+        ("transport received", "{} bytes".format(stats['transport_bytes_received'])),
+    ]
+    print("Stats for {}:".format(_command or "pebble"), file=stream)
+    for label, value in lines:
+        print("  {:<22} {}".format(label + ":", value), file=stream)
@@ -0,0 +1,287 @@
+"""
+Records everything a connection's transport sends and receives (`--record-transport FILE`), and plays it back later
+(`--replay-transport FILE`) without a watch, emulator or phone, so that commands can be re-run deterministically and as
+fast as we can process the messages.
+
+Recordings are a compact binary log. After a header (:data:`MAGIC`, the seed we gave :mod:`random`, and a JSON
+description of the transport) come records, each a ``!BdI`` struct -- kind, seconds since the recording started, payload
+length -- followed by the payload. Messages to or from the watch are stored as the framed packet. Messages to or from
+the phone or QEMU themselves are prefixed with a ``!HHhB`` struct giving the target class, message class (0xFFFF for
+raw bytes), QEMU protocol (-1 for none) and whether the target is raw; those class names are written as :data:`NAME`
+records the first time they're used, and referred to by their index after that.
+"""
+from __future__ import absolute_import, print_function
+
+import importlib
+import json
+import logging
+import os
+import random
+import struct
+import threading
+import time
+
+from pebble_tool.exceptions import ToolError
+from pebble_tool.version import __version__
+
+logger = logging.getLogger("pebble_tool.util.transport_recording")
+
+MAGIC = b'PBLTRNS\x01'
+_HEADER = struct.Struct('!QH')
+_RECORD = struct.Struct('!BdI')
+_OTHER = struct.Struct('!HHhB')
+
+NAME = 0
+WATCH_IN = 1
+WATCH_OUT = 2
+OTHER_IN = 3
+OTHER_OUT = 4
+
+_RAW = 0xFFFF
+
+# If the command hasn't sent what it did when the recording was made by the time it would have had an answer, it's
+# doing something different this time round; give up waiting after this long and replay the answer anyway.
+STALL_TIMEOUT = 1.0
+
+
+def _class_path(cls):
+    return "{}.{}".format(cls.__module__, cls.__name__)
+
+
+def _import_class(path):
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class TransportRecorder(object):
+    def __init__(self, path, transport, handler_name):
+        self.lock = threading.Lock()
+        self.names = {}
+        self.start = time.time()
+        try:
+            self.file = open(path, 'wb')
+        except IOError as e:
+            raise ToolError("Couldn't record the transport to {}: {}".format(path, e))
+        # Replies that depend on random tokens or cookies we send only match on replay if we send the same ones.
+        self.seed = struct.unpack('!Q', os.urandom(8))[0]
+        random.seed(self.seed)
+        meta = json.dumps({
+            'transport': _class_path(type(transport)),
+            'handler': handler_name,
+            'recorded': self.start,
+            'tool_version': __version__,
+        }).encode('utf-8')
+        self.file.write(MAGIC + _HEADER.pack(self.seed, len(meta)) + meta)
+        self.file.flush()
+
+    def _name_index(self, name):
+        # Must be called with the lock held.
+        if name not in self.names:
+            self.names[name] = len(self.names)
+            encoded = name.encode('utf-8')
+            self.file.write(_RECORD.pack(NAME, 0, len(encoded)) + encoded)
+        return self.names[name]
+
+    def write(self, incoming, message, target):
+        from libpebble2.communication.transports import MessageTargetWatch
+        timestamp = time.time() - self.start
+        serialised = message if isinstance(message, bytes) else message.serialise()
+        with self.lock:
+            if self.file.closed:
+                return
+            if isinstance(target, MessageTargetWatch):
+                kind = WATCH_IN if incoming else WATCH_OUT
+                payload = serialised
+            else:
+                kind = OTHER_IN if incoming else OTHER_OUT
+                protocol = getattr(target, 'protocol', None)
+                payload = _OTHER.pack(
+                    self._name_index(_class_path(type(target))),
+                    _RAW if isinstance(message, bytes) else self._name_index(_class_path(type(message))),
+                    -1 if protocol is None else protocol,
+                    1 if getattr(target, 'raw', False) else 0) + serialised
+            self.file.write(_RECORD.pack(kind, timestamp, len(payload)) + payload)
+            # We're usually stopped with ctrl-C, so don't leave anything in the buffer.
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def record(transport, path, handler_name):
+    """Writes everything that passes through a libpebble2 transport to `path`, until it disconnects."""
+    from libpebble2.communication.transports import MessageTargetWatch
+    recorder = TransportRecorder(path, transport, handler_name)
+    send_packet, read_packet = transport.send_packet, transport.read_packet
+
+    def recorded_send_packet(message, target=MessageTargetWatch(), *args, **kwargs):
+        recorder.write(False, message, target)
+        return send_packet(message, target, *args, **kwargs)
+
+    def recorded_read_packet():
+        try:
+            origin, message = read_packet()
+        except Exception:
+            recorder.close()
+            raise
+        recorder.write(True, message, origin)
+        return origin, message
+
+    transport.send_packet = recorded_send_packet
+    transport.read_packet = recorded_read_packet
+    return recorder
+
+
+class Record(object):
+    __slots__ = ('kind', 'timestamp', 'target', 'message_class', 'protocol', 'raw', 'data')
+
+    def __init__(self, kind, timestamp, data, target=None, message_class=None, protocol=None, raw=False):
+        self.kind = kind
+        self.timestamp = timestamp
+        self.data = data
+        self.target = target
+        self.message_class = message_class
+        self.protocol = protocol
+        self.raw = raw
+
+    @property
+    def incoming(self):
+        return self.kind in (WATCH_IN, OTHER_IN)
+
+
+def read_recording(path):
+    """Returns the recording's description and seed, and a list of its :class:`Record` objects."""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except IOError as e:
+        raise ToolError("Couldn't read the transport recording {}: {}".format(path, e))
+    if not content.startswith(MAGIC):
+        raise ToolError("{} isn't a transport recording.".format(path))
+    offset = len(MAGIC)
+    seed, meta_length = _HEADER.unpack_from(content, offset)
+    offset += _HEADER.size
+    meta = json.loads(content[offset:offset + meta_length].decode('utf-8'))
+    offset += meta_length
+
+    names = []
+    records = []
+    while offset + _RECORD.size <= len(content):
+        kind, timestamp, length = _RECORD.unpack_from(content, offset)
+        offset += _RECORD.size
+        payload = content[offset:offset + length]
+        offset += length
+        if len(payload) < length:
+            # We were killed partway through writing this one.
+            break
+        if kind == NAME:
+            names.append(payload.decode('utf-8'))
+        elif kind in (WATCH_IN, WATCH_OUT):
+            records.append(Record(kind, timestamp, payload))
+        else:
+            target, message_class, protocol, raw = _OTHER.unpack_from(payload, 0)
+            records.append(Record(kind, timestamp, payload[_OTHER.size:], target=names[target],
+                                  message_class=None if message_class == _RAW else names[message_class],
+                                  protocol=None if protocol == -1 else protocol, raw=bool(raw)))
+    return meta, seed, records
+
+
+class _ReplayTransportMixin(object):
+    """
+    Plays back a recording in place of the transport it was made with. It's mixed into a subclass of that transport,
+    so that commands checking which kind of transport they have still take the same path they did when recording.
+
+    Each incoming message is held back until we've sent as many messages as had been sent when it originally arrived,
+    so replies never turn up before the requests that asked for them.
+    """
+    def _start_replay(self, path, meta, seed, records):
+        self.replay_path = path
+        self.handler_name = meta.get('handler')
+        self._seed = seed
+        self._records = records
+        self._incoming = []  # (number of messages sent before it arrived, record)
+        self._outgoing = []
+        for record in records:
+            if record.incoming:
+                self._incoming.append((len(self._outgoing), record))
+            else:
+                self._outgoing.append(record)
+        self._next = 0
+        self._sent = 0
+        self._replay_lock = threading.Lock()
+        self._waiter = None
+        self._replaying = False
+
+    @property
+    def connected(self):
+        return self._replaying
+
+    def connect(self):
+        random.seed(self._seed)
+        self._replaying = True
+
+    def send_packet(self, message, target=None, *args, **kwargs):
+        with self._replay_lock:
+            index = self._sent
+            self._sent += 1
+            waiter = self._waiter
+        if index < len(self._outgoing) and self._outgoing[index].kind == WATCH_OUT \
+                and self._outgoing[index].data != message:
+            logger.debug("Sent message %d differs from the recording.", index)
+        if waiter is not None:
+            waiter.set()
+
+    def read_packet(self):
+        from libpebble2.exceptions import ConnectionError
+        from pebble_tool.util.waiting import Waiter
+        if self._next >= len(self._incoming):
+            self._replaying = False
+            raise ConnectionError("Reached the end of the transport recording.")
+        sends_before, record = self._incoming[self._next]
+        self._next += 1
+        deadline = time.time() + STALL_TIMEOUT
+        while True:
+            with self._replay_lock:
+                if self._sent >= sends_before:
+                    break
+                waiter = self._waiter = Waiter()
+            with waiter:
+                if waiter.wait(timeout=max(0, deadline - time.time())) == Waiter.TIMED_OUT:
+                    logger.debug("Replaying message %d without waiting for the messages that preceded it.",
+                                 self._next - 1)
+                    with self._replay_lock:
+                        self._waiter = None
+                    break
+            with self._replay_lock:
+                self._waiter = None
+        return self._decode(record)
+
+    @staticmethod
+    def _decode(record):
+        from libpebble2.communication.transports import MessageTargetWatch
+        if record.kind == WATCH_IN:
+            return MessageTargetWatch(), record.data
+        target = _import_class(record.target)()
+        if record.protocol is not None:
+            target.protocol = record.protocol
+        if record.raw:
+            target.raw = True
+        if record.message_class is None:
+            return target, record.data
+        message, length = _import_class(record.message_class).parse(record.data)
+        return target, message
+
+
+def replay_transport(path):
+    """Returns a transport that plays back the recording at `path`."""
+    meta, seed, records = read_recording(path)
+    try:
+        original = _import_class(meta['transport'])
+    except (ImportError, AttributeError, KeyError):
+        from libpebble2.communication.transports import BaseTransport as original
+    replay_class = type(str('Replay' + original.__name__), (_ReplayTransportMixin, original), {})
+    # The original transport's constructor would try to find whatever it was connected to, so skip it.
+    transport = replay_class.__new__(replay_class)
+    transport._start_replay(path, meta, seed, records)
+    return transport
@@ -1,61 +1,91 @@
 from __future__ import absolute_import, print_function
 __author__ = 'katharine'
 
-import atexit
 import logging
 import math
 import os
 import sys
-import threading
 import time
-import requests
 
 from pebble_tool.version import __version__
 from pebble_tool.sdk import sdk_manager
 from pebble_tool.util.config import config
+from pebble_tool.util.detached import spawn_detached
 from pebble_tool.util.versions import version_to_key
 
 logger = logging.getLogger("pebble_tool.util.updates")
 
 
-class UpdateChecker(threading.Thread):
-    def __init__(self, component, current_version, callback):
-        self.component = component
-        self.current_version = current_version
-        self.callback = callback
-        super(UpdateChecker, self).__init__()
-        self.daemon = True
-        self.start()
-
-    def run(self):
-        last_check = config.get('update-checks', {}).get(self.component, {})
-        if last_check.get('timestamp', 0) < time.time() - 86400:  # minus one day
-            logger.debug("Haven't looked for updates lately; checking...")
-            try:
-                latest = sdk_manager.request("/v1/files/{}/latest?channel={}"
-                                             .format(self.component, sdk_manager.get_channel()))
-            except requests.RequestException as e:
-                logger.info("Update check failed: %s", e)
-                return
-            if not 200 <= latest.status_code < 400:
-                logger.info("Update check failed: %s (%s)", latest.status_code, latest.reason)
-                return
-
-            result = latest.json()
-            with config.lock:
-                config.setdefault('update-checks', {})[self.component] = {
-                    'timestamp': time.time(),
-                    'version': result['version'],
-                    'release_notes': result.get('release_notes', None)
-                }
-            self._check_version(result['version'], result.get('release_notes', None))
-        else:
-            self._check_version(last_check['version'], last_check.get('release_notes', None))
-
-    def _check_version(self, new_version, release_notes=None):
-        if version_to_key(new_version) > version_to_key(self.current_version):
-            logger.debug("Found an update: %s", new_version)
-            atexit.register(self.callback, new_version, release_notes)
+# How often we look for updates, and how long we wait before trying again if looking didn't work.
+CHECK_INTERVAL = 86400
+RETRY_INTERVAL = 3600
+
+
+def _components():
+    """Returns (component name, version we have, function to call if there's something newer) for each component."""
+    components = [("pebble-tool-{}".format(_get_platform()), __version__, _handle_tool_update)]
+    # Only do the SDK update check if there is actually an SDK installed.
+    if sdk_manager.get_current_sdk() is not None:
+        try:
+            latest_sdk = max(sdk_manager.list_local_sdk_versions(), key=version_to_key)
+        except ValueError:
+            latest_sdk = "0"
+        components.append(("sdk-core", latest_sdk, _handle_sdk_update))
+    return components
+
+
+def _is_stale(component):
+    last_check = config.get('update-checks', {}).get(component, {})
+    return last_check.get('timestamp', 0) < time.time() - CHECK_INTERVAL
+
+
+def _check_component(component):
+    import requests
+    logger.debug("Haven't looked for updates lately; checking...")
+    try:
+        latest = sdk_manager.request("/v1/files/{}/latest?channel={}".format(component, sdk_manager.get_channel()))
+    except requests.RequestException as e:
+        logger.info("Update check failed: %s", e)
+        return
+    if not 200 <= latest.status_code < 400:
+        logger.info("Update check failed: %s (%s)", latest.status_code, latest.reason)
+        return
+
+    result = latest.json()
+    with config.lock:
+        config.setdefault('update-checks', {})[component] = {
+            'timestamp': time.time(),
+            'version': result['version'],
+            'release_notes': result.get('release_notes', None)
+        }
+
+
+def run_update_checks():
+    """Looks for updates to anything we haven't checked on lately. This is run in a detached process."""
+    for component, current_version, callback in _components():
+        if _is_stale(component):
+            _check_component(component)
+    config.save()
+
+
+def handle_updates():
+    """
+    Tells the user about any updates we already know about, and arranges for a fresh look in the background if it's
+    been a while (but not too often, in case it keeps failing).
+    """
+    components = _components()
+    checks = config.get('update-checks', {})
+    for component, current_version, callback in components:
+        last_check = checks.get(component)
+        if last_check is not None and version_to_key(last_check['version']) > version_to_key(current_version):
+            logger.debug("Found an update: %s", last_check['version'])
+            callback(last_check['version'], last_check.get('release_notes', None))
+    if any(_is_stale(component) for component, current_version, callback in components):
+        if config.get('update-check-attempted', 0) < time.time() - RETRY_INTERVAL:
+            config.set('update-check-attempted', time.time())
+            # Save now, so that the job (or anyone else) doesn't see an old attempt time and start another.
+            config.save()
+            spawn_detached(__name__, 'run_update_checks')
 
 
 def _print(*args, **kwargs):
@@ -87,28 +117,3 @@ def _handle_tool_update(version, release_notes=None):
 def _get_platform():
     sys_platform = sys.platform.rstrip('2')  # "linux2" on python < 3.3...
     return sys_platform + str(int(round(math.log(sys.maxsize, 2)+1)))
-
-
-def wait_for_update_checks(timeout):
-    now = time.time()
-    end = now + timeout
-    for checker in _checkers:
-        now = time.time()
-        if now > end:
-            break
-        checker.join(end - time.time())
-
-_checkers = []
-
-
-def _do_updates():
-    _checkers.append(UpdateChecker("pebble-tool-{}".format(_get_platform()), __version__, _handle_tool_update))
-    # Only do the SDK update check if there is actually an SDK installed.
-    if sdk_manager.get_current_sdk() is not None:
-        try:
-            latest_sdk = max(sdk_manager.list_local_sdk_versions(), key=version_to_key)
-        except ValueError:
-            latest_sdk = "0"
-        _checkers.append(UpdateChecker("sdk-core", latest_sdk, _handle_sdk_update))
-
-_do_updates()
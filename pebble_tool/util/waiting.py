@@ -0,0 +1,222 @@
+"""
+Lets long-running commands sleep until something actually happens (the watch disconnects, the work is done, or we're
+asked to stop) instead of waking up every so often to check.
+"""
+from __future__ import absolute_import, print_function
+
+import ctypes
+import errno
+import os
+import select
+import signal
+import socket
+import threading
+import time
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_lock = threading.Lock()
+_disconnect_callbacks = weakref.WeakKeyDictionary()
+_thread_waiters = {}
+_interrupted_threads = set()
+
+
+def start_connection(connection):
+    """
+    Does the same as :meth:`PebbleConnection.run_async`, but also calls anything registered with
+    :func:`on_disconnect` when the connection drops.
+    """
+    def run():
+        try:
+            connection.run_sync()
+        finally:
+            with _lock:
+                callbacks = list(_disconnect_callbacks.pop(connection, ()))
+            for callback in callbacks:
+                callback()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.name = "PebbleConnection"
+    thread.parent_ident = threading.current_thread().ident
+    thread.start()
+    connection.fetch_watch_info()
+
+
+def on_disconnect(connection, callback):
+    """
+    Calls `callback` (on the connection's reader thread) when a connection started by :func:`start_connection` drops,
+    or right away if it already has.
+    """
+    with _lock:
+        _disconnect_callbacks.setdefault(connection, []).append(callback)
+    if not connection.connected:
+        remove_disconnect_callback(connection, callback)
+        callback()
+
+
+def remove_disconnect_callback(connection, callback):
+    with _lock:
+        callbacks = _disconnect_callbacks.get(connection, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+
+def interrupt_thread(ident):
+    """
+    Raises :exc:`KeyboardInterrupt` in another thread, as ctrl-C would in the main thread. A thread that's blocked in
+    :meth:`Waiter.wait` (or about to be) is woken up to receive it.
+    """
+    with _lock:
+        _interrupted_threads.add(ident)
+        waiters = list(_thread_waiters.get(ident, ()))
+    _set_async_exc(ident, KeyboardInterrupt)
+    for waiter in waiters:
+        waiter.set(None)
+
+
+def clear_interrupt(ident):
+    """Cancels an interrupt sent by :func:`interrupt_thread` that hasn't been raised yet."""
+    with _lock:
+        _interrupted_threads.discard(ident)
+    _set_async_exc(ident, None)
+
+
+def _socketpair():
+    """Returns a connected pair of sockets, even where :func:`socket.socketpair` doesn't exist (Windows, on Python 2)."""
+    if hasattr(socket, 'socketpair'):
+        return socket.socketpair()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+        return server, client
+    finally:
+        listener.close()
+
+
+def _set_async_exc(ident, exception):
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(ident),
+                                               ctypes.py_object(exception) if exception is not None else None)
+
+
+class Waiter(object):
+    """
+    Blocks the calling thread until another thread calls :meth:`set`, a watched connection drops, we get SIGTERM, or
+    (optionally) a file becomes readable. Ctrl-C still raises :exc:`KeyboardInterrupt` as usual.
+    """
+    COMPLETED = 'completed'
+    DISCONNECTED = 'disconnected'
+    SIGNALLED = 'signalled'
+    READABLE = 'readable'
+    TIMED_OUT = 'timed out'
+
+    def __init__(self):
+        self.reason = None
+        self._closed = False
+        self._set_lock = threading.Lock()
+        self._connections = []
+        if fcntl is not None:
+            self._read_end, self._write_end = os.pipe()
+            flags = fcntl.fcntl(self._write_end, fcntl.F_GETFL)
+            fcntl.fcntl(self._write_end, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        else:
+            # Without fcntl we're probably on Windows, where select() only takes sockets.
+            self._read_end, self._write_end = _socketpair()
+            self._write_end.setblocking(False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def set(self, reason=COMPLETED):
+        """Wakes the waiting thread. The first reason given is the one :meth:`wait` returns."""
+        with self._set_lock:
+            if self._closed:
+                return
+            if self.reason is None:
+                self.reason = reason
+            try:
+                if fcntl is not None:
+                    os.write(self._write_end, b'x')
+                else:
+                    self._write_end.send(b'x')
+            except (OSError, socket.error) as e:
+                # If the pipe is full, the waiting thread has plenty to wake it already.
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+
+    def watch_connection(self, connection):
+        """Wakes us with :attr:`DISCONNECTED` when the connection drops."""
+        self._connections.append(connection)
+        on_disconnect(connection, self._disconnected)
+
+    def _disconnected(self):
+        self.set(self.DISCONNECTED)
+
+    def wait(self, readable=(), timeout=None):
+        """
+        Blocks until we're woken, and returns why. If any of `readable` become readable first, returns
+        :attr:`READABLE` instead, and can be called again once they've been dealt with. If `timeout` seconds pass
+        first, returns :attr:`TIMED_OUT`.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        ident = threading.current_thread().ident
+        with _lock:
+            _thread_waiters.setdefault(ident, set()).add(self)
+        old_handler = None
+        if isinstance(threading.current_thread(), threading._MainThread):
+            old_handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.set(self.SIGNALLED))
+        try:
+            while self.reason is None:
+                if ident in _interrupted_threads:
+                    # The exception we were sent won't be raised until we've run a few more bytecodes, by which
+                    # point we could be blocked again, so raise it ourselves.
+                    clear_interrupt(ident)
+                    raise KeyboardInterrupt
+                remaining = max(0, deadline - time.time()) if deadline is not None else None
+                try:
+                    ready, _, _ = select.select([self._read_end] + list(readable), [], [], remaining)
+                except (select.error, OSError) as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if self._read_end in ready:
+                    if fcntl is not None:
+                        os.read(self._read_end, 4096)
+                    else:
+                        self._read_end.recv(4096)
+                elif ready:
+                    return self.READABLE
+                elif deadline is not None and time.time() >= deadline:
+                    return self.TIMED_OUT
+            return self.reason
+        finally:
+            if old_handler is not None:
+                signal.signal(signal.SIGTERM, old_handler)
+            with _lock:
+                _thread_waiters[ident].discard(self)
+                if not _thread_waiters[ident]:
+                    del _thread_waiters[ident]
+
+    def close(self):
+        with self._set_lock:
+            if self._closed:
+                return
+            self._closed = True
+            if fcntl is not None:
+                os.close(self._read_end)
+                os.close(self._write_end)
+            else:
+                self._read_end.close()
+                self._write_end.close()
+        for connection in self._connections:
+            remove_disconnect_callback(connection, self._disconnected)
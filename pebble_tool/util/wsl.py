@@ -1,8 +1,6 @@
 import socket
 import sys
 
-import websocket
-
 __author__ = 'katharine'
 
 
@@ -18,6 +16,7 @@ def is_secretly_windows():
 
 
 def disable_tcp_keepcnt():
+    import websocket
     if not hasattr(socket, 'TCP_KEEPCNT'):
         return
     for i, (level, optname, value) in enumerate(websocket.DEFAULT_SOCKET_OPTION):
@@ -0,0 +1,23 @@
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+from pebble_tool.commands.base import _CommandRegistry, _LazyCommands, load_all_commands
+
+
+class TestLazyCommands(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_all_commands()
+        cls.commands = {command.command: command for command in _CommandRegistry}
+
+    def test_summaries_match_docstrings(self):
+        for name, (module, summary) in _LazyCommands.items():
+            self.assertIn(name, self.commands, "{} isn't defined".format(name))
+            command = self.commands[name]
+            self.assertEqual(command.__module__, module, "{} is defined in {}".format(name, command.__module__))
+            self.assertEqual(summary, command.__doc__, "The summary of {} doesn't match its docstring".format(name))
+
+    def test_every_command_is_listed(self):
+        for name in self.commands:
+            self.assertIn(name, _LazyCommands, "{} is missing from _LazyCommands".format(name))
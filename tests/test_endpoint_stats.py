@@ -0,0 +1,41 @@
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+from pebble_tool.util.endpoint_stats import percentile, summarise_latencies
+
+
+class TestPercentile(unittest.TestCase):
+    def test_exact_ranks(self):
+        self.assertEqual(percentile([1, 2], 50), 1)
+        self.assertEqual(percentile(list(range(1, 11)), 50), 5)
+        self.assertEqual(percentile(list(range(1, 21)), 95), 19)
+        self.assertEqual(percentile(list(range(1, 101)), 7), 7)
+
+    def test_between_ranks(self):
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+        self.assertEqual(percentile(list(range(1, 11)), 95), 10)
+        self.assertEqual(percentile(list(range(1, 21)), 99), 20)
+
+    def test_extremes(self):
+        self.assertEqual(percentile([4, 5, 6], 0), 4)
+        self.assertEqual(percentile([4, 5, 6], 100), 6)
+        self.assertEqual(percentile([7], 50), 7)
+
+
+class TestSummariseLatencies(unittest.TestCase):
+    def test_summary(self):
+        summary = summarise_latencies([x / 1000 for x in range(20, 0, -1)])
+        self.assertEqual(list(summary.keys()), ['min', 'avg', 'p50', 'p95', 'p99', 'max'])
+        self.assertAlmostEqual(summary['min'], 1)
+        self.assertAlmostEqual(summary['avg'], 10.5)
+        self.assertAlmostEqual(summary['p50'], 10)
+        self.assertAlmostEqual(summary['p95'], 19)
+        self.assertAlmostEqual(summary['max'], 20)
+
+    def test_empty(self):
+        self.assertIsNone(summarise_latencies([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+from libpebble2.exceptions import TimeoutError
+
+from pebble_tool.util.futures import MatchedRequests
+
+
+class FakeConnection(object):
+    connected = True
+
+    def __init__(self):
+        self.handler = None
+        self.sent = []
+
+    def register_endpoint(self, endpoint, handler):
+        self.handler = handler
+        return handler
+
+    def unregister_endpoint(self, handle):
+        self.handler = None
+
+    def send_packet(self, packet):
+        self.sent.append(packet)
+
+
+class Response(object):
+    def __init__(self, cookie):
+        self.cookie = cookie
+
+
+class TestMatchedRequests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.requests = MatchedRequests(self.connection, Response, lambda response: response.cookie)
+
+    def tearDown(self):
+        self.requests.close()
+
+    def test_out_of_order(self):
+        first = self.requests.request('first', 1)
+        second = self.requests.request('second', 2)
+        self.connection.handler(Response(2))
+        self.assertFalse(first.done())
+        self.assertEqual(second.result(0)[0].cookie, 2)
+        self.connection.handler(Response(1))
+        self.assertEqual(first.result(0)[0].cookie, 1)
+        self.assertEqual(self.connection.sent, ['first', 'second'])
+
+    def test_late_response_is_not_given_to_the_next_request(self):
+        first = self.requests.request('first', 1)
+        self.assertRaises(TimeoutError, first.result, 0)
+        second = self.requests.request('second', 2)
+        self.connection.handler(Response(1))
+        self.assertFalse(second.done())
+        self.assertEqual(self.requests.late, 1)
+        self.connection.handler(Response(2))
+        self.assertEqual(second.result(0)[0].cookie, 2)
+        self.assertEqual(self.requests.unmatched, 0)
+
+    def test_unmatched(self):
+        unmatched = []
+        self.requests.on_unmatched = unmatched.append
+        self.connection.handler(Response(3))
+        self.assertEqual(self.requests.unmatched, 1)
+        self.assertEqual([response.cookie for response in unmatched], [3])
+
+
+if __name__ == '__main__':
+    unittest.main()